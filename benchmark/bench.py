@@ -0,0 +1,156 @@
+""" Benchmark of sequence and programming throughput with a fake ST CLI
+
+Usage:
+    python -m benchmark.bench [--probes N] [--iterations N] [--cli stm32|stlink] [--connect S] [--write S]
+"""
+
+import argparse
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+from time import monotonic
+
+from helper.files import load_yaml, save_yaml
+from helper.load import TaskPool, load_task
+from helper.runner import get_steps, run_sequence
+from helper.timing import MemorySink, summary, tracer
+from tasks.utility.firmware import parse_hex
+
+FAKE_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_st_cli.py')
+
+
+def make_cli(folder: str, cli: str) -> str:
+    """Create the fake CLI executable
+
+    Args:
+        folder (str): folder of the executable
+        cli (str): stm32 or stlink
+
+    Returns:
+        str: executable full file name
+    """
+    name = 'ST-LINK_CLI' if cli == 'stlink' else 'STM32_Programmer_CLI'
+    if sys.platform == 'win32':
+        filename = os.path.join(folder, name + '.bat')
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write(f'@"{sys.executable}" "{FAKE_CLI}" %*\n')
+        return filename
+    filename = os.path.join(folder, name)
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_CLI}" "$@"\n')
+    os.chmod(filename, os.stat(filename).st_mode | stat.S_IEXEC)
+    return filename
+
+
+def make_hex(filename: str, size: int, addr: int=0x08000000) -> None:
+    """Create an Intel HEX firmware
+
+    Args:
+        filename (str): HEX file
+        size (int): firmware size in bytes
+        addr (int, optional): base address. Defaults to 0x08000000.
+    """
+    def record(offset: int, rtype: int, data: bytes) -> str:
+        raw = bytes([len(data), offset >> 8 & 0xFF, offset & 0xFF, rtype]) + data
+        return ':' + (raw + bytes([-sum(raw) & 0xFF])).hex().upper() + '\n'
+
+    lines = []
+    for offset in range(0, size, 16):
+        if offset % 0x10000 == 0:
+            lines.append(record(0, 4, ((addr + offset) >> 16).to_bytes(2, 'big')))
+        lines.append(record((addr + offset) & 0xFFFF, 0, bytes((offset + num) & 0xFF for num in range(16))))
+    lines.append(record(0, 1, b''))
+    with open(filename, 'w', encoding='ascii') as file:
+        file.writelines(lines)
+
+
+def measure(name: str, iterations: int, func) -> float:
+    """Run func iterations times and print the mean latency
+
+    Returns:
+        float: mean seconds
+    """
+    start = monotonic()
+    for _ in range(iterations):
+        func()
+    mean = (monotonic() - start) / iterations
+    print(f'{name:<24} {mean * 1000:10.3f} ms')
+    return mean
+
+
+def run_task(module: str, config_path: str, args: dict) -> None:
+    """Build and run a task, the benchmark stops if the task fails: a failed run is not a latency
+
+    Args:
+        module (str): task module name
+        config_path (str): path where config files are saved
+        args (dict): task params
+    """
+    task = load_task(module, config_path, args)
+    task.run()
+    if task.error:
+        sys.exit(f'Task "{module}" failed: {task.error}')
+
+
+def main() -> None:
+    """ Benchmark entry point """
+    parser = argparse.ArgumentParser(description='pyTask benchmark with a fake ST CLI')
+    parser.add_argument('--cli', choices=['stm32', 'stlink'], default='stm32')
+    parser.add_argument('--probes', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--connect', type=float, default=0.05, help='seconds for each SWD connection')
+    parser.add_argument('--write', type=float, default=0.2, help='seconds for each write operation')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='firmware size in bytes')
+    opts = parser.parse_args()
+
+    os.environ.update({'FAKE_ST_CLI': opts.cli, 'FAKE_ST_PROBES': str(opts.probes),
+                       'FAKE_ST_CONNECT': str(opts.connect), 'FAKE_ST_WRITE': str(opts.write)})
+    sink = MemorySink()
+    tracer.add_sink(sink)
+
+    with tempfile.TemporaryDirectory() as folder:
+        config_path = os.path.join(folder, 'config')
+        os.makedirs(config_path)
+        firmware_file = os.path.join(folder, 'firmware.hex')
+        make_hex(firmware_file, opts.size)
+        save_yaml({'say_ho_ho': 'Ho ho ho!'}, os.path.join(config_path, 'test_task.yml'), False)
+        save_yaml({'programmer': make_cli(folder, opts.cli), 'batch': True, 'max_workers': None,
+                   'firmware_cache': os.path.join(folder, 'cache')},
+                  os.path.join(config_path, 'program_st_task.yml'), False)
+        firmware = {'file': firmware_file, 'addr': 0x08000000, 'freq': 4000, 'prot': 0}
+        args = {'loader': None, 'bootloader': None, 'firmware': firmware}
+        sequence = {'Name': 'Benchmark', 'Description': 'Benchmark', 'Tasks': [
+            {'task': f'Task {num}', 'module': 'test_task', 'args': None} for num in range(20)]}
+        sequence_file = os.path.join(folder, 'sequence.yml')
+        save_yaml(sequence, sequence_file, False)
+
+        print(f'Fake {opts.cli} CLI, {opts.probes} probes, connect {opts.connect}s, write {opts.write}s')
+        measure('sequence load', opts.iterations, lambda: get_steps(load_yaml(sequence_file)))
+        measure('HEX parse and check', opts.iterations, lambda: parse_hex(firmware_file))
+        measure('sequence run (20 tasks)', opts.iterations,
+                lambda: asyncio.run(run_sequence(sequence, config_path)))
+        measure('task construction', opts.iterations,
+                lambda: load_task('program_st_task', config_path, args))
+        warm = TaskPool()
+        warm.release('program_st_task', config_path, warm.acquire('program_st_task', config_path, args))
+        measure('task reuse (pool)', opts.iterations,
+                lambda: warm.release('program_st_task', config_path,
+                                     warm.acquire('program_st_task', config_path, args)))
+        sink.clear()
+
+        os.environ['FAKE_ST_PROBES'] = '1'
+        single = measure('single-board flash', opts.iterations,
+                         lambda: run_task('program_st_task', config_path, args))
+        os.environ['FAKE_ST_PROBES'] = str(opts.probes)
+        fanout = measure('fan-out flash', opts.iterations,
+                         lambda: run_task('program_st_task', config_path, dict(args, fanout=True)))
+
+        print(f'\n{"single-board":<24} {3600 / single:10.0f} boards/hour')
+        print(f'{"fan-out":<24} {3600 * opts.probes / fanout:10.0f} boards/hour')
+        print(f'\n{summary(sink.clear())}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+""" Stand-in of STM32_Programmer_CLI / ST-LINK_CLI for benchmarks
+
+Environment:
+    FAKE_ST_CLI: stm32 (default) or stlink
+    FAKE_ST_PROBES: number of probes listed (default 1)
+    FAKE_ST_CONNECT: seconds for each SWD connection (default 0.05)
+    FAKE_ST_WRITE: seconds for each write/erase operation (default 0.2)
+    FAKE_ST_LIST: seconds to list the probes (default 0.05)
+"""
+
+import os
+import sys
+import time
+
+
+def env(name: str, default: str) -> str:
+    """ Environment value """
+    return os.environ.get(name, default)
+
+
+def write(seconds: float) -> None:
+    """ Simulate a write operation with its progress bar """
+    for num in range(1, 11):
+        time.sleep(seconds / 10)
+        sys.stdout.write(f'\r  {"#" * num:<10} {num * 10}%')
+        sys.stdout.flush()
+    print()
+
+
+def probes() -> list[str]:
+    """ Serial numbers of the fake probes """
+    return [f'066DFF{num:06d}' for num in range(int(env('FAKE_ST_PROBES', '1')))]
+
+
+def stm32(args: list[str]) -> int:
+    """ STM32_Programmer_CLI """
+    if args == ['--version']:
+        print('      -------------------------------------------------------------------')
+        print('                        STM32CubeProgrammer v2.14.0')
+        print('      -------------------------------------------------------------------')
+        print('')
+        print('STM32CubeProgrammer version: 2.14.0 (fake)')
+        return 0
+    if args == ['--List']:
+        time.sleep(float(env('FAKE_ST_LIST', '0.05')))
+        for num, serial in enumerate(probes()):
+            print(f'ST-Link Probe {num} :')
+            print(f'   ST-LINK SN  : {serial}')
+        return 0
+    if '-c' not in args:
+        print('Error: unknown command')
+        return 1
+    time.sleep(float(env('FAKE_ST_CONNECT', '0.05')))
+    for num, arg in enumerate(args):
+        if arg in ('-w', '-e'):
+            write(float(env('FAKE_ST_WRITE', '0.2')))
+        elif arg == '-u':
+            with open(args[num + 3], 'wb') as file:
+                file.write(b'\xff' * int(args[num + 2]))
+        elif arg == '-ob' and args[num + 1] == 'displ':
+            print('RDP          : 0xAA (Level 0, no protection)')
+    print('Download verified successfully')
+    return 0
+
+
+def stlink(args: list[str]) -> int:
+    """ ST-LINK_CLI """
+    if args == ['-v']:
+        print('ST-LINK_CLI.exe V3.6.0.0 (fake)')
+        return 0
+    if args == ['-List']:
+        time.sleep(float(env('FAKE_ST_LIST', '0.05')))
+        for num, serial in enumerate(probes()):
+            print(f'ST-LINK Probe {num} :')
+            print(f'   ST-LINK SN: {serial}')
+        return 0
+    if '-c' not in args:
+        print('Error: unknown command')
+        return 1
+    time.sleep(float(env('FAKE_ST_CONNECT', '0.05')))
+    for num, arg in enumerate(args):
+        if arg in ('-P', '-ME', '-SE'):
+            write(float(env('FAKE_ST_WRITE', '0.2')))
+        elif arg == '-Dump':
+            with open(args[num + 3], 'wb') as file:
+                file.write(b'\xff' * int(args[num + 2], 16))
+        elif arg == '-rOB':
+            print('RDP : Level 0')
+    print('Programming Complete.')
+    return 0
+
+
+if __name__ == '__main__':
+    if env('FAKE_ST_CLI', 'stm32') == 'stlink':
+        sys.exit(stlink(sys.argv[1:]))
+    sys.exit(stm32(sys.argv[1:]))
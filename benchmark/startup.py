@@ -0,0 +1,70 @@
+""" Startup benchmark of the headless runner: import time budget and forbidden (GUI) modules
+
+Usage:
+    python -m benchmark.startup [--budget MS] [--runs N]
+
+Exit code is 1 if the import time is over budget or a GUI module is imported.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+FORBIDDEN = ('PyQt6', 'PySide6', 'shiboken6', 'qt6_applications', 'pyqt6_plugins', 'numpy')
+
+
+def import_times(args: list[str]) -> dict[str, tuple[int, bool]]:
+    """Run the runner with -X importtime
+
+    Args:
+        args (list[str]): runner args
+
+    Returns:
+        dict[str, tuple[int, bool]]: cumulative import time in microseconds of each module and if it is top level
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', MAIN] + args, capture_output=True, text=True,
+                         check=False, cwd=os.path.dirname(MAIN))
+    modules = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented
+        modules[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()) == 1)
+    return modules
+
+
+def main() -> None:
+    """ Startup benchmark entry point """
+    parser = argparse.ArgumentParser(description='pyTask headless startup benchmark')
+    parser.add_argument('--budget', type=float, default=100.0, help='max import time in ms')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('args', nargs='*', default=['--help'], help='runner args (default --help)')
+    opts = parser.parse_args()
+
+    totals = []
+    modules = {}
+    for _ in range(opts.runs):
+        modules = import_times(opts.args)
+        totals.append(sum(time for time, top in modules.values() if top) / 1000)
+    best = min(totals)
+    print(f'Import time: best {best:.1f} ms, mean {sum(totals) / len(totals):.1f} ms (budget {opts.budget} ms)')
+    print('Slowest imports:')
+    for name, (time, _) in sorted(modules.items(), key=lambda item: -item[1][0])[:10]:
+        print(f'  {time / 1000:8.1f} ms  {name}')
+
+    failed = False
+    gui = sorted({name.split('.')[0] for name in modules} & set(FORBIDDEN))
+    if gui:
+        print(f'FAIL: GUI/heavy modules imported: {", ".join(gui)}')
+        failed = True
+    if best > opts.budget:
+        print('FAIL: import time over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+Helper function to run a sequence on many stations: a coordinator dispatches the devices under test to the workers
+
+The workers connect to the coordinator on TCP and exchange JSON lines:
+
+- worker: `{"type": "hello", "name": ..., "probes": [...], "tasks": [...]}`, probes attached and task modules installed;
+- coordinator: `{"type": "job", "id": 1, "sequence": {...}, "unit": {...}}`, a sequence to run for a device;
+- worker: `{"type": "result", "id": 1, "result": {...}}`, the result of the device.
+
+A job goes to a free worker with all the task modules of the sequence (and the probe of the device, if given), the
+worker with less jobs done first. The jobs of a worker disconnected are given to another worker. A job that none of
+the workers connected accepts is failed.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from collections import deque
+from enum import Enum
+from time import monotonic, sleep
+from typing import Callable, Iterator
+from helper.load import registry
+from helper.metrics import queue_depth
+from helper.production import ProductionLoop
+from helper.runner import get_steps
+
+
+class WorkerLink:
+    """
+    A worker connected to the coordinator
+    """
+    def __init__(self, conn: socket.socket, stream, hello: dict):
+        """
+        Constructor
+
+        Args:
+            conn (socket.socket): connection
+            stream (TextIO): connection stream
+            hello (dict): worker advertisement
+        """
+        self.conn = conn
+        self.stream = stream
+        self.name = str(hello.get('name'))
+        self.probes = set(hello.get('probes') or [])
+        self.tasks = set(hello.get('tasks') or [])
+        self.job = None
+        self.done = 0
+        self.failed = 0
+        self.busy = 0.0
+
+    def accepts(self, job: dict) -> bool:
+        """ True if the worker can run the job """
+        probe = job['unit'].get('probe')
+        return job['modules'] <= self.tasks and (not probe or probe in self.probes)
+
+    def send(self, msg: dict) -> None:
+        """ Send a message """
+        self.stream.write(json.dumps(msg) + '\n')
+        self.stream.flush()
+
+
+class Coordinator:
+    """
+    Job queue of (sequence, device) dispatched to the workers
+
+    `on_result` is called with the result of each device, with the `worker` name added.
+    """
+    def __init__(self, host: str='127.0.0.1', port: int=0):
+        """
+        Constructor
+
+        Args:
+            host (str, optional): address to listen. Defaults to '127.0.0.1'.
+            port (int, optional): port to listen. Defaults to 0 (a free port).
+        """
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()[:2]
+        self._jobs = deque()
+        self._workers = []
+        self._cond = threading.Condition()
+        self._next_id = 1
+        self._running = 0
+        self._reporting = 0
+        self._done = 0
+        self._failed = 0
+        self._started = monotonic()
+        self.on_result = None
+
+    def start(self) -> None:
+        """ Accept the workers in background """
+        threading.Thread(target=self.__accept, name='coordinator', daemon=True).start()
+        logging.info('Coordinator listening on %s:%d', *self.address)
+
+    def __accept(self) -> None:
+        """ Accept loop, a thread for each worker """
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.__serve, args=(conn,), name='coordinator-link', daemon=True).start()
+
+    def __serve(self, conn: socket.socket) -> None:
+        """ Receive the results of a worker """
+        link = None
+        with conn, conn.makefile('rw', encoding='utf-8', newline='\n') as stream:
+            try:
+                hello = json.loads(stream.readline() or 'null')
+                if not isinstance(hello, dict) or hello.get('type') != 'hello':
+                    return
+                link = WorkerLink(conn, stream, hello)
+                with self._cond:
+                    self._workers.append(link)
+                logging.info('Worker %s: probes %s, %d tasks', link.name, sorted(link.probes), len(link.tasks))
+                self.__dispatch()
+                for line in stream:
+                    msg = json.loads(line)
+                    if msg.get('type') == 'result':
+                        self.__completed(link, msg['result'])
+            except (OSError, ValueError) as ex:
+                logging.warning('Worker %s: %s', link.name if link else conn, ex)
+            finally:
+                if link is not None:
+                    self.__disconnected(link)
+
+    def __completed(self, link: WorkerLink, result: dict) -> None:
+        """ Save the result of a job and give a new job to the worker """
+        result['worker'] = link.name
+        with self._cond:
+            link.busy += monotonic() - link.job['sent']
+            link.job = None
+            self._running -= 1
+            self._done += 1
+            link.done += 1
+            if result.get('status') != 'PASS':
+                self._failed += 1
+                link.failed += 1
+            self._reporting += 1
+        self.__report(result)
+        self.__dispatch()
+
+    def __report(self, result: dict) -> None:
+        """ Give a result to `on_result`, join waits the results still being reported """
+        try:
+            if callable(self.on_result):
+                self.on_result(result)
+        finally:
+            with self._cond:
+                self._reporting -= 1
+                self._cond.notify_all()
+
+    def __disconnected(self, link: WorkerLink) -> None:
+        """ Remove a worker, its job goes back to the queue """
+        with self._cond:
+            self._workers.remove(link)
+            if link.job is not None:
+                logging.warning('Worker %s disconnected, job %d queued again', link.name, link.job['id'])
+                self._jobs.appendleft(link.job)
+                link.job = None
+                self._running -= 1
+            else:
+                logging.info('Worker %s disconnected', link.name)
+        self.__dispatch()
+
+    def __dispatch(self) -> None:
+        """ Give the queued jobs to the free workers, the jobs that no worker connected accepts are failed """
+        sent = []
+        rejected = []
+        with self._cond:
+            for link in sorted(self._workers, key=lambda link: link.done):
+                if link.job is not None:
+                    continue
+                job = next((job for job in self._jobs if link.accepts(job)), None)
+                if job is None:
+                    continue
+                self._jobs.remove(job)
+                job['sent'] = monotonic()
+                link.job = job
+                self._running += 1
+                sent.append((link, job))
+            if self._workers:
+                rejected = [job for job in self._jobs if not any(link.accepts(job) for link in self._workers)]
+                for job in rejected:
+                    self._jobs.remove(job)
+                    self._done += 1
+                    self._failed += 1
+                self._reporting += len(rejected)
+            queue_depth.set(len(self._jobs), queue='jobs')
+        for job in rejected:
+            error = f'No worker can run job {job["id"]}: tasks {sorted(job["modules"])}, ' \
+                    f'probe {job["unit"].get("probe")}'
+            logging.error(error)
+            self.__report({'unit': job['unit'], 'status': 'FAIL', 'errors': [error], 'duration': 0.0,
+                           'tasks': [], 'report': '', 'worker': None})
+        for link, job in sent:
+            try:
+                link.send({'type': 'job', 'id': job['id'], 'sequence': job['sequence'], 'unit': job['unit']})
+            except OSError:
+                pass                                                            # the job is queued again on disconnect
+
+    def submit(self, sequence: dict, unit: dict) -> int:
+        """Queue a job
+
+        Args:
+            sequence (dict): sequence loaded
+            unit (dict): device under test
+
+        Returns:
+            int: job id
+        """
+        modules = {step['module'] for step in get_steps(sequence)}
+        with self._cond:
+            job = {'id': self._next_id, 'sequence': sequence, 'unit': unit, 'modules': modules}
+            self._next_id += 1
+            self._jobs.append(job)
+        self.__dispatch()
+        return job['id']
+
+    def join(self, timeout: float|None=None) -> bool:
+        """Wait the end of all the jobs queued, and that their results are given to `on_result`
+
+        Args:
+            timeout (float | None, optional): max seconds. Defaults to None.
+
+        Returns:
+            bool: True if all the jobs are done
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._jobs and not self._running and not self._reporting, timeout)
+
+    def stats(self) -> dict:
+        """Throughput of the line
+
+        Returns:
+            dict: jobs pending, running, done, failed, units per hour and the same for each worker
+        """
+        with self._cond:
+            elapsed = max(monotonic() - self._started, 1e-9)
+            return {'pending': len(self._jobs), 'running': self._running, 'done': self._done,
+                    'failed': self._failed, 'units_per_hour': round(self._done * 3600 / elapsed, 1),
+                    'workers': [{'name': link.name, 'probes': sorted(link.probes), 'done': link.done,
+                                 'failed': link.failed, 'busy': round(link.busy, 3)} for link in self._workers]}
+
+    def close(self) -> None:
+        """ Stop listening and disconnect the workers """
+        self._server.close()
+        with self._cond:
+            workers = list(self._workers)
+        for link in workers:
+            try:
+                link.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class Worker:
+    """
+    Station running the jobs received from the coordinator
+    """
+    def __init__(self, config_path: str, name: str|None=None, probes: list[str]|None=None,
+                 tasks: list[str]|None=None, event: Callable[[Enum, str], None]|None=None):
+        """
+        Constructor
+
+        Args:
+            config_path (str): path where config files are saved
+            name (str | None, optional): worker name. Defaults to None (host name and process id).
+            probes (list[str] | None, optional): probes attached. Defaults to None.
+            tasks (list[str] | None, optional): task modules installed. Defaults to None (tasks of the registry).
+            event (Callable[[Enum, str], None] | None, optional): callback function. Defaults to None.
+        """
+        self._config_path = config_path
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.probes = list(probes or [])
+        self.tasks = list(tasks) if tasks is not None else sorted(registry.discover())
+        self._event = event
+        self._loops = {}
+
+    def __jobs(self, stream) -> Iterator[dict]:
+        """ Jobs received """
+        for line in stream:
+            msg = json.loads(line)
+            if msg.get('type') == 'job':
+                yield msg
+
+    def __connect(self, host: str, port: int, wait: float) -> socket.socket:
+        """ Connect to the coordinator, retry until it is listening """
+        deadline = monotonic() + wait
+        while True:
+            try:
+                return socket.create_connection((host, port))
+            except ConnectionRefusedError:
+                if monotonic() > deadline:
+                    raise
+                sleep(0.5)
+
+    def run(self, host: str, port: int, wait: float=30.0) -> int:
+        """Connect to the coordinator and run the jobs until it closes the connection
+
+        Args:
+            host (str): coordinator address
+            port (int): coordinator port
+            wait (float, optional): seconds to wait the coordinator. Defaults to 30.0.
+
+        Returns:
+            int: jobs done
+        """
+        done = 0
+        try:
+            with self.__connect(host, port, wait) as conn, \
+                 conn.makefile('rw', encoding='utf-8', newline='\n') as stream:
+                hello = {'type': 'hello', 'name': self.name, 'probes': self.probes, 'tasks': self.tasks}
+                stream.write(json.dumps(hello) + '\n')
+                stream.flush()
+                logging.info('Worker %s connected to %s:%d', self.name, host, port)
+                for job in self.__jobs(stream):
+                    key = json.dumps(job['sequence'], sort_keys=True)
+                    if key not in self._loops:
+                        self._loops[key] = ProductionLoop(job['sequence'], self._config_path, self._event)
+                    result = self._loops[key].run_unit(job['unit'])
+                    stream.write(json.dumps({'type': 'result', 'id': job['id'], 'result': result}) + '\n')
+                    stream.flush()
+                    done += 1
+        except OSError as ex:
+            logging.warning('Worker %s: %s', self.name, ex)
+        finally:
+            for loop in self._loops.values():
+                loop.close()
+            self._loops.clear()
+        return done
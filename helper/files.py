@@ -1,10 +1,22 @@
 """
 Helper function to manage YAML and files
 """
+import copy
 import os
 import sys
+import threading
+from collections import OrderedDict
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+YAML_CACHE_SIZE = 64
+_yaml_cache = OrderedDict()
+_yaml_lock = threading.Lock()
+
 def ext_chg(fullfilename: str, extension: str) -> str:
     """Change the file extension
 
@@ -22,6 +34,8 @@ def ext_chg(fullfilename: str, extension: str) -> str:
 def load_yaml(fullfilename: str) -> dict:
     """Load a YAML file into a dictionary_
 
+    The files parsed are cached by path, modification time and size: the dictionary returned is a copy.
+
     Args:
         fullfilename (str): file to load
 
@@ -33,10 +47,22 @@ def load_yaml(fullfilename: str) -> dict:
     """
     if not os.path.isfile(fullfilename):
         raise FileNotFoundError
-    with open(fullfilename, 'r', encoding='utf-8') as file:
-        cnf = yaml.safe_load(file)
-        return cnf
-    return {}
+    path = os.path.abspath(fullfilename)
+    info = os.stat(path)
+    key = (info.st_mtime_ns, info.st_size)
+    with _yaml_lock:
+        cached = _yaml_cache.get(path)
+        if cached is not None and cached[0] == key:
+            _yaml_cache.move_to_end(path)
+            return copy.deepcopy(cached[1])
+    with open(path, 'r', encoding='utf-8') as file:
+        cnf = yaml.load(file, Loader=SafeLoader)
+    with _yaml_lock:
+        _yaml_cache[path] = (key, cnf)
+        _yaml_cache.move_to_end(path)
+        while len(_yaml_cache) > YAML_CACHE_SIZE:
+            _yaml_cache.popitem(last=False)
+    return copy.deepcopy(cnf)
 
 def save_yaml(data: dict, fullfilename: str, backup: bool=True) -> None:
     """Save a dictionary as YAML file
@@ -46,6 +72,8 @@ def save_yaml(data: dict, fullfilename: str, backup: bool=True) -> None:
         fullfilename (str): yaml file
         backup (bool, optional): if True create a backup file. Defaults to True.
     """
+    with _yaml_lock:
+        _yaml_cache.pop(os.path.abspath(fullfilename), None)
     # Backup old yaml file
     backupfilename = ext_chg(fullfilename, '.bak')
     if os.path.isfile(fullfilename):
@@ -0,0 +1,196 @@
+"""
+Helper function to run tasks in warm worker processes, isolated from the runner
+
+A task runs in a worker process with the task modules, the configs and the task instances kept warm: its events are
+sent back over a pipe, it is killed if it exceeds the time limit and its memory can be limited, a crash does not stop
+the runner.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+from enum import Enum
+from multiprocessing.connection import Connection
+from time import monotonic
+from typing import Callable
+
+
+def _worker_main(conn: Connection, configs: dict, memory_limit: int|None) -> None:
+    """Worker process loop: run the tasks received and send back events and result
+
+    Args:
+        conn (Connection): pipe with the runner
+        configs (dict): configs already loaded by full file name
+        memory_limit (int | None): max bytes of the process address space (POSIX only)
+    """
+    # pylint: disable=import-outside-toplevel
+    if memory_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError):
+            pass
+    from helper.load import TaskPool
+    from tasks.template_task import TaskBase
+    TaskBase.preload(configs)
+    tasks = TaskPool()
+
+    def on_event(status: Enum, msg: str) -> None:
+        conn.send(('event', status, msg))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        module, config_path, args, unit = job
+        try:
+            tsk = tasks.acquire(module, config_path, args, on_event)
+            tsk.set_unit(unit)
+            tsk.run()
+            tasks.release(module, config_path, tsk)
+            conn.send(('done', tsk._unit, tsk.error))                            # pylint: disable=protected-access
+        except BaseException as ex:                                             # pylint: disable=broad-exception-caught
+            conn.send(('error', repr(ex)))
+
+
+class ProcessWorker:
+    """
+    A worker process and its pipe
+    """
+    def __init__(self, configs: dict, memory_limit: int|None=None):
+        """ Constructor: start the process """
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, configs, memory_limit), daemon=True,
+                                   name='task-worker')
+        self.process.start()
+        child.close()
+
+    def kill(self) -> None:
+        """ Stop the process now """
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        """ Stop the process at the end of the current job """
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+
+
+class ProcessPool:
+    """
+    Pool of warm worker processes
+    """
+    def __init__(self, size: int=2, configs: dict|None=None, memory_limit: int|None=None):
+        """
+        Constructor
+
+        Args:
+            size (int, optional): worker processes. Defaults to 2.
+            configs (dict | None, optional): configs already loaded by full file name. Defaults to None.
+            memory_limit (int | None, optional): max bytes of each worker (POSIX only). Defaults to None.
+        """
+        self._configs = configs or {}
+        self._memory_limit = memory_limit
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(self.__spawn())
+
+    def __spawn(self) -> ProcessWorker:
+        """ Start a new worker """
+        worker = ProcessWorker(self._configs, self._memory_limit)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def __replace(self, worker: ProcessWorker) -> None:
+        """ Kill a worker and start a new one """
+        worker.kill()
+        with self._lock:
+            self._workers.remove(worker)
+        self._idle.put(self.__spawn())
+
+    def run(self, module: str, config_path: str, args: dict, unit: dict|None=None,
+            event: Callable[[Enum, str], None]|None=None, timeout: float|None=None) -> tuple[dict, str|None]:
+        """Run a task in a worker process and wait the end
+
+        Args:
+            module (str): task module name
+            config_path (str): path where config files are saved
+            args (dict): task params
+            unit (dict | None, optional): device under test. Defaults to None.
+            event (Callable[[Enum, str], None] | None, optional): callback function. Defaults to None.
+            timeout (float | None, optional): max seconds, then the worker is killed. Defaults to None.
+
+        Raises:
+            TimeoutError: Raises if the task exceeds the time limit
+            RuntimeError: Raises if the task fails or the worker process crashes
+
+        Returns:
+            tuple[dict, str|None]: device under test updated by the task and the error reported by the task
+        """
+        worker = self._idle.get()
+        try:
+            worker.conn.send((module, config_path, args, unit or {}))
+            deadline = None if timeout is None else monotonic() + timeout
+            while True:
+                if not worker.conn.poll(None if deadline is None else max(deadline - monotonic(), 0)):
+                    self.__replace(worker)
+                    raise TimeoutError(f'Task "{module}" killed after {timeout} s!')
+                kind, *data = worker.conn.recv()
+                if kind == 'event':
+                    if callable(event):
+                        try:
+                            event(*data)
+                        except Exception:                                       # pylint: disable=broad-exception-caught
+                            logging.exception('Task "%s": event callback failed', module)
+                    continue
+                self._idle.put(worker)
+                if kind == 'error':
+                    raise RuntimeError(f'Task "{module}" failed: {data[0]}')
+                return data[0], data[1]
+        except (EOFError, BrokenPipeError, ConnectionResetError) as ex:
+            worker.process.join(5)
+            logging.error('Task "%s": worker process crashed (exit code %s)', module, worker.process.exitcode)
+            self.__replace(worker)
+            raise RuntimeError(f'Task "{module}" crashed the worker process!') from ex
+
+    def close(self) -> None:
+        """ Stop all the workers """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_process_pool(size: int=2, configs: dict|None=None, memory_limit: int|None=None) -> ProcessPool:
+    """
+    Return the pool with the given size and memory limit, created the first time and kept warm
+
+    Args:
+        size (int, optional): worker processes. Defaults to 2.
+        configs (dict | None, optional): configs already loaded by full file name. Defaults to None.
+        memory_limit (int | None, optional): max bytes of each worker (POSIX only). Defaults to None.
+
+    Returns:
+        ProcessPool: pool
+    """
+    with _pools_lock:
+        key = (size, memory_limit)
+        if key not in _pools:
+            _pools[key] = ProcessPool(size, configs, memory_limit)
+        return _pools[key]
@@ -1,11 +1,197 @@
 """
 Helper function to manage module and task loading
 """
+import ast
+import os
+import sys
+import threading
 from importlib import import_module
 from enum import Enum
 from typing import Callable
 from tasks.template_task import TaskBase
 
+TASKS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tasks')
+ENTRY_POINT_GROUP = 'pytask.tasks'
+
+
+class TaskRegistry:
+    """
+    Index of the available tasks, modules are imported only when used
+
+    The tasks are the modules of the `tasks` folder with a `get_task` function and the entry points of the
+    `pytask.tasks` group.
+    """
+    def __init__(self, tasks_path: str=TASKS_PATH):
+        """
+        Constructor
+
+        Args:
+            tasks_path (str, optional): folder of the task modules. Defaults to the `tasks` folder.
+        """
+        self._tasks_path = tasks_path
+        self._index = None
+        self._factories = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _scan_file(filename: str) -> dict|None:
+        """ Read a task module without importing it, None if it is not a task """
+        with open(filename, 'r', encoding='utf-8') as file:
+            tree = ast.parse(file.read(), filename)
+        functions = [node.name for node in tree.body if isinstance(node, ast.FunctionDef)]
+        if 'get_task' not in functions:
+            return None
+        version = None
+        execution = TaskBase.execution
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef) and node.name == 'version':
+                for ret in ast.walk(node):
+                    if isinstance(ret, ast.Return) and isinstance(ret.value, ast.Constant):
+                        version = ret.value.value
+            if isinstance(node, ast.ClassDef):
+                for assign in node.body:
+                    if isinstance(assign, ast.Assign) and isinstance(assign.value, ast.Constant) and \
+                       any(isinstance(target, ast.Name) and target.id == 'execution' for target in assign.targets):
+                        execution = assign.value.value
+        return {'version': version, 'execution': execution}
+
+    def discover(self) -> dict[str, dict]:
+        """Index of the tasks by name, built only the first time
+
+        Returns:
+            dict[str, dict]: module, file, version, execution and config file name of each task
+        """
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            index = {}
+            filenames = os.listdir(self._tasks_path) if os.path.isdir(self._tasks_path) else []
+            for filename in sorted(filenames):
+                name, ext = os.path.splitext(filename)
+                if ext != '.py' or name.startswith('_'):
+                    continue
+                fullfilename = os.path.join(self._tasks_path, filename)
+                info = self._scan_file(fullfilename)
+                if info is not None:
+                    index[name] = {'module': f'tasks.{name}', 'file': fullfilename, 'config': name + '.yml', **info}
+            from importlib.metadata import entry_points                        # pylint: disable=import-outside-toplevel
+            for entry in entry_points(group=ENTRY_POINT_GROUP):
+                index.setdefault(entry.name, {'module': entry.value.split(':')[0], 'file': None,
+                                              'config': entry.name + '.yml', 'version': None, 'execution': None})
+            self._index = index
+            return index
+
+    def get_factory(self, name: str) -> Callable[..., TaskBase]:
+        """Return the `get_task` function of a task, the module is imported the first time
+
+        Args:
+            name (str): task module name
+
+        Raises:
+            ImportError: Raises if the module doesn't exist
+
+        Returns:
+            Callable[..., TaskBase]: task factory
+        """
+        factory = self._factories.get(name)
+        if factory is not None:
+            return factory
+        with self._lock:
+            if name not in self._factories:
+                info = self.discover().get(name)
+                module = import_module(info['module'] if info is not None else f'tasks.{name}')
+                self._factories[name] = getattr(module, 'get_task')
+            return self._factories[name]
+
+    def get_execution(self, name: str) -> str:
+        """Return the `execution` of a task class ('thread' or 'process') without building the task
+
+        Args:
+            name (str): task module name
+
+        Returns:
+            str: execution declared by the task class, for an entry point read from the classes of its module
+        """
+        info = self.discover().get(name)
+        if info is not None and info['execution'] is not None:
+            return info['execution']
+        module = sys.modules[self.get_factory(name).__module__]
+        classes = [value for value in vars(module).values()
+                   if isinstance(value, type) and issubclass(value, TaskBase) and value.__module__ == module.__name__]
+        return 'process' if any(cls.execution == 'process' for cls in classes) else TaskBase.execution
+
+    def prewarm(self, names: list[str]) -> threading.Thread:
+        """Import the tasks in a background thread
+
+        Args:
+            names (list[str]): task module names
+
+        Returns:
+            threading.Thread: thread started
+        """
+        def warm() -> None:
+            for name in dict.fromkeys(names):
+                try:
+                    self.get_factory(name)
+                except Exception:                                               # pylint: disable=broad-exception-caught
+                    pass
+        thread = threading.Thread(target=warm, name='task-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+
+registry = TaskRegistry()
+
+
+class TaskPool:
+    """
+    Task instances kept warm by module and config path
+
+    A task is built once (config, resources, backend detection) and reused: every run gets its args by `configure`.
+    An instance is used by one run at a time, a task failed is not reused.
+    """
+    def __init__(self):
+        """ Constructor """
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def idle(self, module_name: str, config_path: str) -> int:
+        """ Number of instances ready for a module """
+        with self._lock:
+            return len(self._idle.get((module_name, os.path.abspath(config_path)), []))
+
+    def acquire(self, module_name: str, config_path: str, args: dict,
+                event: Callable[[Enum, str], None]|None=None) -> TaskBase:
+        """Return an instance ready with the args, built if no one is idle
+
+        Args:
+            module_name (str): task module name
+            config_path (str): path where config files are saved
+            args (dict): task params
+            event (Callable[[Enum, str], None] | None, optional): callback function. Defaults to None.
+
+        Returns:
+            TaskBase: task
+        """
+        with self._lock:
+            idle = self._idle.get((module_name, os.path.abspath(config_path)))
+            tsk = idle.pop() if idle else None
+        if tsk is None:
+            return load_task(module_name, config_path, args, event)
+        tsk.configure(args)
+        tsk.set_event(event)
+        return tsk
+
+    def release(self, module_name: str, config_path: str, tsk: TaskBase) -> None:
+        """ Give back an instance after the run """
+        with self._lock:
+            self._idle.setdefault((module_name, os.path.abspath(config_path)), []).append(tsk)
+
+    def clear(self) -> None:
+        """ Drop all the instances """
+        with self._lock:
+            self._idle.clear()
+
 
 def load_module(module_name: str, alias: str|None=None) -> None:
     """Import an external module
@@ -33,6 +219,5 @@ def load_task(module_name: str, config_path: str, args: dict, event: Callable[[E
     Returns:
         TaskBase: _description_
     """
-    module = import_module(f'tasks.{module_name}')
-    factory = getattr(module, 'get_task')
+    factory = registry.get_factory(module_name)
     return factory(config_path, args, event)
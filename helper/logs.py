@@ -0,0 +1,116 @@
+"""
+Helper function to log without blocking: records are queued and written by a background thread
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from contextlib import contextmanager
+from typing import Iterator
+
+CONTEXT_FIELDS = ('sequence', 'serial', 'task')
+
+_context = contextvars.ContextVar('log_context', default={})
+
+
+def set_context(**fields) -> contextvars.Token:
+    """Add fields (sequence, serial, task) to the log records of the current context
+
+    Args:
+        fields: context fields
+
+    Returns:
+        contextvars.Token: token to restore the previous context
+    """
+    return _context.set({**_context.get(), **fields})
+
+
+def reset_context(token: contextvars.Token) -> None:
+    """ Restore the previous context """
+    _context.reset(token)
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """ Add fields (sequence, serial, task) to the log records of a block of code """
+    token = set_context(**fields)
+    try:
+        yield
+    finally:
+        reset_context(token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Add the context fields to the records, in the thread that logs
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        record.context = ''.join(f'[{context[field]}] ' for field in CONTEXT_FIELDS if context.get(field))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the records as JSON lines with the context fields
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        data = {'time': self.formatTime(record, self.datefmt), 'level': record.levelname,
+                'thread': record.threadName, 'message': record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            if getattr(record, field, None) is not None:
+                data[field] = getattr(record, field)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        elif record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue the records with the message formatted and the traceback kept apart, in `exc_text`, for the formatter
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None                                                  # the traceback objects are not queued
+        return record
+
+
+def setup_logging(log_cnf: dict) -> logging.handlers.QueueListener:
+    """Log through a queue: the file is written by a background thread
+
+    Args:
+        log_cnf (dict): Logger config: filename, level and format (text or json)
+
+    Returns:
+        logging.handlers.QueueListener: listener started, stopped at exit
+    """
+    folder = os.path.dirname(log_cnf['filename'])
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    handler = logging.handlers.TimedRotatingFileHandler(filename=log_cnf['filename'], when='W0', interval=4)
+    if log_cnf.get('format') == 'json':
+        handler.setFormatter(JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S'))
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)-9s: %(context)s%(message)s',
+                                               datefmt='%Y-%m-%d %H:%M:%S'))
+    records = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    logging.basicConfig(handlers=[queue_handler], level=log_cnf['level'])
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
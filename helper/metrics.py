@@ -0,0 +1,269 @@
+"""
+Helper function to keep live metrics of the line: counters, gauges and histograms in memory
+
+The metrics are exported in the Prometheus text format by a local HTTP `/metrics` endpoint and by a snapshot file
+written periodically. Recording is a dictionary update under a lock, cheap enough for every task and programming.
+"""
+import logging
+import os
+import threading
+from bisect import bisect_left
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    """ Prometheus labels of a sample """
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """
+    Value that only increases (e.g. units completed)
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...]=()):
+        """
+        Constructor
+
+        Args:
+            name (str): metric name
+            doc (str): help text
+            labels (tuple[str, ...], optional): label names. Defaults to ().
+        """
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float=1.0, **labels) -> None:
+        """ Increase the value of the labels """
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        """ Value of the labels """
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0.0)
+
+    def samples(self) -> list[str]:
+        """ Lines of the text format """
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_labels(self.labels, key)} {value:g}' for key, value in sorted(values)]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down (e.g. queue depth)
+    """
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        """ Set the value of the labels """
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float=1.0, **labels) -> None:
+        """ Decrease the value of the labels """
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """
+    Distribution of the observed values (e.g. durations) in buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...]=(), buckets: tuple[float, ...]=DURATION_BUCKETS):
+        """
+        Constructor
+
+        Args:
+            name (str): metric name
+            doc (str): help text
+            labels (tuple[str, ...], optional): label names. Defaults to ().
+            buckets (tuple[float, ...], optional): upper bounds. Defaults to DURATION_BUCKETS.
+        """
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        """ Add a value to the distribution of the labels """
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def get(self, **labels) -> tuple[int, float]:
+        """ Count and sum of the values of the labels """
+        data = self._values.get(tuple(labels.get(name, '') for name in self.labels))
+        return (0, 0.0) if data is None else (data[2], data[1])
+
+    def samples(self) -> list[str]:
+        """ Lines of the text format """
+        with self._lock:
+            values = [(key, list(data[0]), data[1], data[2]) for key, data in self._values.items()]
+        lines = []
+        for key, counts, total, count in sorted(values):
+            cumulative = 0
+            for bound, num in zip(self.buckets + (float('inf'),), counts):
+                cumulative += num
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), key + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {total:g}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {count}')
+        return lines
+
+
+class Metrics:
+    """
+    Metrics of the process, exported in the Prometheus text format
+    """
+    def __init__(self):
+        """ Constructor """
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._snapshot = None
+
+    def __add(self, metric: Counter|Gauge|Histogram) -> Counter|Gauge|Histogram:
+        """ Register a metric, the one already registered with the same name is returned """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, doc: str, labels: tuple[str, ...]=()) -> Counter:
+        """ Return the counter with the name, created the first time """
+        return self.__add(Counter(name, doc, labels))
+
+    def gauge(self, name: str, doc: str, labels: tuple[str, ...]=()) -> Gauge:
+        """ Return the gauge with the name, created the first time """
+        return self.__add(Gauge(name, doc, labels))
+
+    def histogram(self, name: str, doc: str, labels: tuple[str, ...]=(),
+                  buckets: tuple[float, ...]=DURATION_BUCKETS) -> Histogram:
+        """ Return the histogram with the name, created the first time """
+        return self.__add(Histogram(name, doc, labels, buckets))
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text format
+
+        Returns:
+            str: text exposition
+        """
+        with self._lock:
+            items = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in items:
+            lines.append(f'# HELP {metric.name} {metric.doc}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, filename: str) -> None:
+        """ Write the metrics to a file, replaced atomically """
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp = filename + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(temp, filename)
+
+    def start_snapshot(self, filename: str, interval: float=10.0) -> None:
+        """Write the snapshot file periodically in a background thread, and at stop
+
+        Args:
+            filename (str): snapshot file
+            interval (float, optional): seconds between two snapshots. Defaults to 10.0.
+        """
+        stop = threading.Event()
+        def loop() -> None:
+            while not stop.wait(interval):
+                try:
+                    self.write_snapshot(filename)
+                except OSError as ex:
+                    logging.warning('Metrics snapshot %s: %s', filename, ex)
+        thread = threading.Thread(target=loop, name='metrics-snapshot', daemon=True)
+        thread.start()
+        self._snapshot = (stop, thread, filename)
+
+    def serve(self, host: str, port: int) -> tuple[str, int]:
+        """Expose `/metrics` on a local HTTP server in a background thread
+
+        Args:
+            host (str): address to listen
+            port (int): port to listen, 0 for a free port
+
+        Returns:
+            tuple[str, int]: address and port listening
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """ GET /metrics """
+            def do_GET(self) -> None:                                          # pylint: disable=invalid-name
+                """ Reply the metrics """
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:                      # pylint: disable=redefined-builtin
+                return
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logging.info('Metrics on http://%s:%d/metrics', *self._server.server_address[:2])
+        return self._server.server_address[:2]
+
+    def stop(self) -> None:
+        """ Stop the HTTP server and write the last snapshot """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._snapshot is not None:
+            stop, thread, filename = self._snapshot
+            stop.set()
+            thread.join()
+            self.write_snapshot(filename)
+            self._snapshot = None
+
+
+metrics = Metrics()
+
+units_total = metrics.counter('pytask_units_total', 'Devices under test completed by status', ('status',))
+unit_seconds = metrics.histogram('pytask_unit_seconds', 'Sequence time of a device under test')
+tasks_total = metrics.counter('pytask_tasks_total', 'Tasks executed by task and status', ('task', 'status'))
+task_seconds = metrics.histogram('pytask_task_seconds', 'Run time of a task', ('task',))
+task_wait_seconds = metrics.histogram('pytask_task_wait_seconds', 'Time a ready task waited a free worker',
+                                      ('task',))
+flash_seconds = metrics.histogram('pytask_flash_seconds', 'Programming time by probe and result',
+                                  ('probe', 'result'))
+queue_depth = metrics.gauge('pytask_queue_depth', 'Items waiting in a queue', ('queue',))
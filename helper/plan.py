@@ -0,0 +1,113 @@
+"""
+Helper function to compile a sequence into a validated plan, cached between runs
+"""
+import hashlib
+import os
+import pickle
+from importlib import import_module
+from helper.files import load_yaml
+from helper.load import registry
+from helper.runner import get_steps
+
+PLAN_VERSION = 1
+
+
+def validate_args(args: dict|None, schema: dict, where: str) -> None:
+    """Validate task args with the schema of the task
+
+    The schema has an entry for each arg: `type` (type or tuple of types), `required` (default True) and for
+    dictionaries the nested `schema`.
+
+    Args:
+        args (dict | None): task args
+        schema (dict): args schema
+        where (str): task name used in the error message
+
+    Raises:
+        ValueError: Raises if an arg is missing or has a wrong type
+    """
+    if not isinstance(args, dict):
+        raise ValueError(f'Task "{where}": args must be a dictionary!')
+    for key, rule in schema.items():
+        if key not in args:
+            if rule.get('required', True):
+                raise ValueError(f'Task "{where}": missing arg "{key}"!')
+            continue
+        value = args[key]
+        if 'type' in rule and not isinstance(value, rule['type']):
+            raise ValueError(f'Task "{where}": arg "{key}" has type {type(value).__name__}!')
+        if 'schema' in rule and value is not None:
+            validate_args(value, rule['schema'], f'{where}.{key}')
+
+
+def file_digest(filename: str) -> str:
+    """ SHA-256 of a file """
+    with open(filename, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def compile_sequence(seq_file: str, config_path: str) -> dict:
+    """Compile a sequence: resolve the task modules, load their config and validate the args
+
+    Args:
+        seq_file (str): sequence file
+        config_path (str): path where config files are saved
+
+    Raises:
+        ValueError: Raises if the sequence is not valid
+
+    Returns:
+        dict: plan with sequence, configs (by config file) and sources (digest by file)
+    """
+    sequence = load_yaml(seq_file)
+    steps = get_steps(sequence)
+    sources = {os.path.abspath(seq_file): file_digest(seq_file)}
+    configs = {}
+    for step in steps:
+        try:
+            module = import_module(getattr(registry.get_factory(step['module']), '__module__'))
+        except (ImportError, AttributeError) as ex:
+            raise ValueError(f'Task "{step["name"]}": unknown module "{step["module"]}"!') from ex
+        sources[os.path.abspath(module.__file__)] = file_digest(module.__file__)
+        schema = getattr(module, 'ARGS_SCHEMA', None)
+        if schema is not None:
+            validate_args(step['args'], schema, step['name'])
+        cnf_file = os.path.join(os.path.abspath(config_path), step['module'] + '.yml')
+        if os.path.isfile(cnf_file) and cnf_file not in configs:
+            configs[cnf_file] = load_yaml(cnf_file)
+            sources[cnf_file] = file_digest(cnf_file)
+    return {'version': PLAN_VERSION, 'sequence': sequence, 'configs': configs, 'sources': sources}
+
+
+def load_plan(seq_file: str, config_path: str, cache_path: str|None=None) -> dict:
+    """Return the plan of a sequence, compiled only if the sequence, the configs or the task modules are changed
+
+    Args:
+        seq_file (str): sequence file
+        config_path (str): path where config files are saved
+        cache_path (str | None, optional): folder of the compiled plans. Defaults to None (no cache).
+
+    Raises:
+        ValueError: Raises if the sequence is not valid
+
+    Returns:
+        dict: plan with sequence, configs (by config file) and sources (digest by file)
+    """
+    if cache_path is None:
+        return compile_sequence(seq_file, config_path)
+    seq_key = hashlib.sha256(os.path.abspath(seq_file).encode('utf-8')).hexdigest()[:16]
+    plan_file = os.path.join(cache_path, f'{os.path.basename(seq_file)}.{seq_key}.plan')
+    try:
+        with open(plan_file, 'rb') as file:
+            plan = pickle.load(file)
+        if plan.get('version') == PLAN_VERSION and \
+           all(os.path.isfile(src) and file_digest(src) == digest for src, digest in plan['sources'].items()):
+            return plan
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        pass
+    plan = compile_sequence(seq_file, config_path)
+    os.makedirs(cache_path, exist_ok=True)
+    with open(plan_file + '.tmp', 'wb') as file:
+        pickle.dump(plan, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(plan_file + '.tmp', plan_file)
+    return plan
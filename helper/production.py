@@ -0,0 +1,182 @@
+"""
+Helper function to run a sequence on a queue of devices under test
+"""
+import asyncio
+import csv
+import json
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from time import monotonic
+from typing import Callable, Iterable, Iterator, TextIO
+from helper.load import TaskPool
+from helper.logs import log_context
+from helper.metrics import unit_seconds, units_total
+from helper.runner import get_steps, run_sequence
+from helper.scheduler import Schedule
+
+
+def units_from_csv(filename: str) -> Iterator[dict]:
+    """Devices from a CSV file with header (e.g. serial)
+
+    Args:
+        filename (str): CSV file
+
+    Yields:
+        dict: device
+    """
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        yield from csv.DictReader(file)
+
+
+def parse_unit(line: str) -> dict|None:
+    """Device from a text line: a JSON object or the serial number
+
+    Args:
+        line (str): text line
+
+    Raises:
+        ValueError: Raises if the JSON object is not valid
+
+    Returns:
+        dict|None: device, None if the line is empty
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        return json.loads(line)
+    return {'serial': line}
+
+
+def units_from_stream(stream: TextIO, on_error: Callable[[str], None]|None=None) -> Iterator[dict]:
+    """Devices from a text stream (e.g. stdin), one for each line, the lines not valid are skipped
+
+    Args:
+        stream (TextIO): text stream
+        on_error (Callable[[str], None] | None, optional): called with the error of a line not valid.
+                                                          Defaults to None.
+
+    Yields:
+        dict: device
+    """
+    for line in stream:
+        try:
+            unit = parse_unit(line)
+        except ValueError as ex:
+            logging.warning('Invalid unit %r: %s', line.strip(), ex)
+            if callable(on_error):
+                on_error(f'Invalid unit: {ex}')
+            continue
+        if unit is not None:
+            yield unit
+
+
+class ProductionLoop:
+    """
+    Run a sequence for each device, the tasks are loaded only for the first one and kept warm in a pool
+
+    `on_result` is called with the result of each device (e.g. to save it).
+    """
+    def __init__(self, sequence: dict, config_path: str, event: Callable[[Enum, str], None]|None=None,
+                 max_workers: int|None=None):
+        """
+        Constructor
+
+        Args:
+            sequence (dict): sequence loaded
+            config_path (str): path where config files are saved
+            event (Callable[[Enum, str], None] | None, optional): callback function. Defaults to None.
+            max_workers (int | None, optional): max tasks running at the same time. Defaults to None
+                                                (`Workers` of the sequence, if missing 4).
+        """
+        self._sequence = sequence
+        self._config_path = config_path
+        self._event = event
+        self._max_workers = max_workers or sequence.get('Workers') or 4
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='task')
+        self._loop = asyncio.new_event_loop()
+        self._tasks = TaskPool()
+        self._errors = []
+        self.on_result = None
+
+    def _on_event(self, status: Enum, msg: str) -> None:
+        """ Forward the task events and keep the errors of the current device """
+        if isinstance(status.value, int) and status.value < 0:
+            self._errors.append(msg)
+        if callable(self._event):
+            self._event(status, msg)
+
+    def run_unit(self, unit: dict) -> dict:
+        """Run the sequence for a device
+
+        Args:
+            unit (dict): device under test
+
+        Returns:
+            dict: result with unit, status (PASS or FAIL), errors, duration, tasks (status and times) and report
+        """
+        self._errors = []
+        start = monotonic()
+        result = {'unit': unit, 'status': 'PASS', 'errors': [], 'duration': 0.0, 'tasks': [], 'report': ''}
+        schedule = Schedule(get_steps(self._sequence))
+        try:
+            with log_context(serial=unit.get('serial') or unit.get('probe')):
+                self._loop.run_until_complete(
+                    run_sequence(self._sequence, self._config_path, self._on_event, self._executor,
+                                 self._max_workers, self._tasks, unit, schedule))
+        except Exception as ex:                                                 # pylint: disable=broad-exception-caught
+            logging.exception('Unit %s failed', unit)
+            self._errors.append(repr(ex))
+        result['duration'] = monotonic() - start
+        result['tasks'] = schedule.tasks()
+        result['report'] = schedule.report()
+        result['errors'] = list(self._errors)
+        if self._errors:
+            result['status'] = 'FAIL'
+        units_total.inc(status=result['status'])
+        unit_seconds.observe(result['duration'])
+        if callable(self.on_result):
+            self.on_result(result)
+        return result
+
+    def run(self, units: Iterable[dict]) -> Iterator[dict]:
+        """Run the sequence for each device
+
+        Args:
+            units (Iterable[dict]): devices under test
+
+        Yields:
+            dict: result of each device
+        """
+        for unit in units:
+            yield self.run_unit(unit)
+
+    def serve(self, host: str, port: int) -> None:
+        """Receive the devices on a local TCP socket, one for each line, and reply the result as JSON line
+
+        A line not valid is replied with `{"error": ...}`, a client disconnected does not stop the server.
+
+        Args:
+            host (str): address to listen
+            port (int): port to listen
+        """
+        with socket.create_server((host, port)) as server:
+            logging.info('Listening on %s:%d', host, port)
+            while True:
+                conn, address = server.accept()
+                try:
+                    with conn, conn.makefile('rw', encoding='utf-8', newline='\n') as stream:
+                        def reply(msg: dict) -> None:
+                            stream.write(json.dumps(msg) + '\n')
+                            stream.flush()
+                        for unit in units_from_stream(stream, lambda error: reply({'error': error})):
+                            reply(self.run_unit(unit))
+                except (OSError, UnicodeDecodeError) as ex:
+                    logging.warning('Client %s:%d disconnected: %s', *address[:2], ex)
+
+    def close(self) -> None:
+        """ Release the executor and the event loop """
+        self._executor.shutdown()
+        self._loop.close()
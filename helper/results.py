@@ -0,0 +1,218 @@
+"""
+Helper function to store the result of every unit in an append-only SQLite database
+
+Query from command line:
+    python -m helper.results <database> units [--serial S] [--firmware F] [--status S] [--since T] [--limit N]
+    python -m helper.results <database> summary [--since T]
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    serial TEXT,
+    firmware TEXT,
+    sequence TEXT,
+    status TEXT NOT NULL,
+    duration REAL,
+    errors TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS unit_tasks (
+    unit_id INTEGER NOT NULL REFERENCES units(id),
+    task TEXT NOT NULL,
+    status TEXT NOT NULL,
+    wait REAL,
+    duration REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS units_time ON units(time);
+CREATE INDEX IF NOT EXISTS units_serial ON units(serial, time);
+CREATE INDEX IF NOT EXISTS units_firmware ON units(firmware, time);
+CREATE INDEX IF NOT EXISTS unit_tasks_unit ON unit_tasks(unit_id);
+CREATE INDEX IF NOT EXISTS unit_tasks_task ON unit_tasks(task, status);
+"""
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    """Open the database in WAL mode and create the tables
+
+    Args:
+        filename (str): database file
+
+    Returns:
+        sqlite3.Connection: connection
+    """
+    folder = os.path.dirname(filename)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(filename, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class ResultStore:
+    """
+    Append the unit results, written in batches by a background thread so the line is never slowed down
+    """
+    def __init__(self, filename: str, batch_size: int=100, flush_interval: float=1.0):
+        """
+        Constructor
+
+        Args:
+            filename (str): database file
+            batch_size (int, optional): max units of a transaction. Defaults to 100.
+            flush_interval (float, optional): max seconds before the units are written. Defaults to 1.0.
+        """
+        self._filename = filename
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._conn = connect(filename)
+        self._thread = threading.Thread(target=self.__run, name='result-store', daemon=True)
+        self._thread.start()
+
+    def add(self, result: dict, sequence: str|None=None) -> None:
+        """
+        Add the result of a unit, it is written later
+
+        Args:
+            result (dict): unit result (unit, status, errors, duration, tasks)
+            sequence (str | None, optional): sequence name. Defaults to None.
+        """
+        self._queue.put((time.time(), sequence, result))
+
+    def close(self) -> None:
+        """ Write the pending results and close the database """
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def __run(self) -> None:
+        """ Writer thread """
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.__write(batch)
+
+    def __write(self, batch: list[tuple[float, str|None, dict]]) -> None:
+        """ Write a batch of units in a transaction """
+        with self._conn:
+            for stamp, sequence, result in batch:
+                unit = dict(result.get('unit') or {})
+                cursor = self._conn.execute(
+                    'INSERT INTO units (time, serial, firmware, sequence, status, duration, errors, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (stamp, unit.get('serial') or unit.get('probe'), unit.get('firmware'), sequence,
+                     result.get('status'), result.get('duration'), json.dumps(result.get('errors', [])),
+                     json.dumps(unit)))
+                self._conn.executemany(
+                    'INSERT INTO unit_tasks (unit_id, task, status, wait, duration, error) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(cursor.lastrowid, task['task'], task['status'], task['wait'], task['duration'], task['error'])
+                     for task in result.get('tasks', [])])
+
+
+def query_units(conn: sqlite3.Connection, serial: str|None=None, firmware: str|None=None,
+                status: str|None=None, since: float|None=None, limit: int=100) -> list[dict]:
+    """Return the last units matching the filters
+
+    Args:
+        conn (sqlite3.Connection): connection
+        serial (str | None, optional): serial number. Defaults to None.
+        firmware (str | None, optional): firmware SHA-256. Defaults to None.
+        status (str | None, optional): PASS or FAIL. Defaults to None.
+        since (float | None, optional): epoch seconds. Defaults to None.
+        limit (int, optional): max units. Defaults to 100.
+
+    Returns:
+        list[dict]: units, newest first
+    """
+    where, params = [], []
+    for column, value in (('serial', serial), ('firmware', firmware), ('status', status)):
+        if value is not None:
+            where.append(f'{column} = ?')
+            params.append(value)
+    if since is not None:
+        where.append('time >= ?')
+        params.append(since)
+    sql = 'SELECT id, time, serial, firmware, sequence, status, duration, errors FROM units'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY time DESC LIMIT ?'
+    rows = conn.execute(sql, params + [limit]).fetchall()
+    keys = ('id', 'time', 'serial', 'firmware', 'sequence', 'status', 'duration', 'errors')
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def summary(conn: sqlite3.Connection, since: float|None=None) -> dict:
+    """Return yield, cycle time and failures by task
+
+    Args:
+        conn (sqlite3.Connection): connection
+        since (float | None, optional): epoch seconds. Defaults to None.
+
+    Returns:
+        dict: units, passed, failed, mean and max duration, failures by task
+    """
+    since = since or 0
+    units, passed, mean, longest = conn.execute(
+        "SELECT COUNT(*), SUM(status = 'PASS'), AVG(duration), MAX(duration) FROM units WHERE time >= ?",
+        (since,)).fetchone()
+    failures = conn.execute(
+        "SELECT t.task, COUNT(*) FROM unit_tasks t JOIN units u ON u.id = t.unit_id "
+        "WHERE u.time >= ? AND t.status = 'FAIL' GROUP BY t.task ORDER BY COUNT(*) DESC", (since,)).fetchall()
+    return {'units': units, 'passed': passed or 0, 'failed': units - (passed or 0), 'mean_duration': mean,
+            'max_duration': longest, 'failures_by_task': dict(failures)}
+
+
+def main() -> None:
+    """ Query command line """
+    parser = argparse.ArgumentParser(description='pyTask result store query')
+    parser.add_argument('database')
+    parser.add_argument('command', choices=['units', 'summary'])
+    parser.add_argument('--serial')
+    parser.add_argument('--firmware')
+    parser.add_argument('--status', choices=['PASS', 'FAIL'])
+    parser.add_argument('--since', type=float, help='epoch seconds, negative: seconds before now')
+    parser.add_argument('--limit', type=int, default=100)
+    opts = parser.parse_args()
+
+    since = opts.since
+    if since is not None and since < 0:
+        since = time.time() + since
+    conn = connect(opts.database)
+    if opts.command == 'summary':
+        print(json.dumps(summary(conn, since), indent=2))
+    else:
+        for unit in query_units(conn, opts.serial, opts.firmware, opts.status, since, opts.limit):
+            print(json.dumps(unit))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Helper function to run a sequence of tasks
+"""
+import contextvars
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
+from typing import Callable
+from helper.load import TaskPool, load_task, registry
+from helper.logs import set_context
+from helper.metrics import queue_depth, task_seconds, task_wait_seconds, tasks_total
+from tasks.template_task import TaskBase
+from helper.scheduler import Schedule, topological_order
+from helper.timing import tracer
+
+
+def check_task(task: dict, num: int) -> None:
+    """Check the keys of a task entry
+
+    Args:
+        task (dict): task entry of the sequence
+        num (int): entry number, used in the error message if the task has no name
+
+    Raises:
+        ValueError: Raises if a key is missing
+    """
+    if not isinstance(task, dict):
+        raise ValueError(f'Task of entry {num} must be a dictionary!')
+    where = task.get('name', task.get('task', f'entry {num}'))
+    for key in ('task', 'module', 'args'):
+        if key not in task:
+            raise ValueError(f'Task "{where}": missing "{key}"!')
+    if not isinstance(task['module'], str):
+        raise ValueError(f'Task "{where}": "module" must be a string!')
+
+
+def get_steps(sequence: dict) -> list[dict]:
+    """Flatten the sequence tasks into steps with name and dependencies
+
+    A sequence entry can be a task or a group of tasks (`group` name and `tasks` list) executed at the same time.
+    Without `needs` (or `depends_on`) a task depends on the previous entry of the sequence, so a plain list runs
+    serially. With `execution: process` a task runs in a worker process, with optional `timeout` (s) and `memory`
+    (MB) limits.
+
+    Args:
+        sequence (dict): sequence loaded
+
+    Raises:
+        ValueError: Raises if a task or a group misses a key, a name is duplicated, a dependency is unknown or the
+                    dependencies have a cycle
+
+    Returns:
+        list[dict]: steps with keys name, task, module, args, depends_on
+    """
+    if not isinstance(sequence, dict) or not isinstance(sequence.get('Tasks'), list):
+        raise ValueError('Missing "Tasks" list in the sequence!')
+    steps = []
+    previous = []
+    for num, entry in enumerate(sequence['Tasks'], 1):
+        if not isinstance(entry, dict):
+            raise ValueError(f'Entry {num} of the sequence must be a dictionary!')
+        if 'group' in entry and not isinstance(entry.get('tasks'), list):
+            raise ValueError(f'Group "{entry["group"]}": missing "tasks" list!')
+        members = entry['tasks'] if 'group' in entry else [entry]
+        names = []
+        for task in members:
+            check_task(task, num)
+            step = dict(task)
+            step['name'] = str(task.get('name', task['task']))
+            depends_on = task.get('needs', task.get('depends_on', previous))
+            step['depends_on'] = [depends_on] if isinstance(depends_on, str) else list(depends_on or [])
+            steps.append(step)
+            names.append(step['name'])
+        previous = names
+
+    known = set()
+    for step in steps:
+        if step['name'] in known:
+            raise ValueError(f'Duplicated task name "{step["name"]}"!')
+        known.add(step['name'])
+    for step in steps:
+        for dep in step['depends_on']:
+            if dep not in known:
+                raise ValueError(f'Task "{step["name"]}" depends on unknown task "{dep}"!')
+    topological_order(steps)
+    return steps
+
+
+async def run_sequence(sequence: dict, config_path: str, event: Callable[[Enum, str], None]|None=None,
+                       executor: Executor|None=None, max_workers: int|None=None,
+                       tasks: TaskPool|None=None, unit: dict|None=None,
+                       schedule: Schedule|None=None) -> Schedule:
+    """Run a sequence: every task starts as soon as its dependencies are completed and a worker is free
+
+    Args:
+        sequence (dict): sequence loaded
+        config_path (str): path where config files are saved
+        event (Callable[[Enum, str], None] | None, optional): callback function. Defaults to None.
+        executor (Executor | None, optional): executor for blocking tasks. Defaults to None (a thread pool).
+        max_workers (int | None, optional): max tasks running at the same time. Defaults to None
+                                            (`Workers` of the sequence, if missing 4).
+        tasks (TaskPool | None, optional): pool where the task instances are kept warm and reused with the args
+                                           of each step. Defaults to None (tasks loaded at every run).
+        unit (dict | None, optional): device under test, given to every task. Defaults to None.
+        schedule (Schedule | None, optional): schedule where the timings are saved, it is available also if the
+                                              sequence fails. Defaults to None (a new one).
+
+    Returns:
+        Schedule: timings of the run
+    """
+    import asyncio                                                             # pylint: disable=import-outside-toplevel
+    if max_workers is None:
+        max_workers = sequence.get('Workers') or 4
+    steps = get_steps(sequence)
+    if schedule is None:
+        schedule = Schedule(steps)
+    loop = asyncio.get_running_loop()
+    workers = asyncio.Semaphore(max_workers)
+    running = {}
+
+    async def run_step(step: dict) -> None:
+        for dep in step['depends_on']:
+            await running[dep]
+        schedule.ready(step['name'])
+        queue_depth.inc(queue='tasks')
+        async with workers:
+            queue_depth.dec(queue='tasks')
+            try:
+                await run_task(step)
+            except BaseException as ex:
+                schedule.failed(step['name'], ex)
+                raise
+            finally:
+                timing = schedule.timings[step['name']]
+                tasks_total.inc(task=step['name'], status=timing.status)
+                if timing.end:
+                    task_wait_seconds.observe(timing.wait, task=step['name'])
+                    task_seconds.observe(timing.duration, task=step['name'])
+
+    async def run_task(step: dict) -> None:
+        set_context(task=step['name'])
+        schedule.started(step['name'])
+        if executions[step['name']] == 'process':
+            error = await run_isolated(step)
+            schedule.completed(step['name'])
+            if error is not None:
+                schedule.failed(step['name'], RuntimeError(error))
+            return
+        if tasks is None or not tasks.idle(step['module'], config_path):
+            logging.info('Load: %s, module <%s>', step['task'], step['module'])
+        load = load_task if tasks is None else tasks.acquire
+        with tracer.span('load', task=step['name'], module=step['module']):
+            tsk = await loop.run_in_executor(pool, contextvars.copy_context().run, load, step['module'],
+                                             config_path, step['args'], event)
+        tsk.set_unit(unit or {})
+        await tsk.run_async(pool)
+        error = tsk.error
+        if tasks is not None:
+            tasks.release(step['module'], config_path, tsk)
+        schedule.completed(step['name'])
+        if error is not None:
+            schedule.failed(step['name'], RuntimeError(error))
+
+    async def run_isolated(step: dict) -> str|None:
+        # pylint: disable-next=import-outside-toplevel
+        from helper.isolation import get_process_pool
+        memory = step.get('memory')
+        configs = TaskBase._preloaded                                           # pylint: disable=protected-access
+        processes = get_process_pool(sequence.get('ProcessWorkers') or 2, configs,
+                                     int(memory) * 1024 * 1024 if memory else None)
+        logging.info('Run: %s, module <%s> in a worker process', step['task'], step['module'])
+        with tracer.span('process', task=step['name'], module=step['module']):
+            result, error = await loop.run_in_executor(pool, contextvars.copy_context().run, processes.run,
+                                                       step['module'], config_path, step['args'], unit, event,
+                                                       step.get('timeout'))
+        if unit is not None:
+            unit.update(result)
+        return error
+
+    executions = {step['name']: step.get('execution') or registry.get_execution(step['module']) for step in steps}
+    if tasks is None or any(not tasks.idle(step['module'], config_path) for step in steps):
+        registry.prewarm([step['module'] for step in steps])
+    own_pool = executor is None
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task') if own_pool else executor
+    try:
+        for name in schedule.order:
+            step = next(step for step in steps if step['name'] == name)
+            running[name] = asyncio.ensure_future(run_step(step))
+        results = await asyncio.gather(*running.values(), return_exceptions=True)
+    finally:
+        if own_pool:
+            pool.shutdown(wait=False)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return schedule
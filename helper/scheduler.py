@@ -0,0 +1,146 @@
+"""
+Helper function to schedule the tasks of a sequence as a dependency graph
+"""
+from time import monotonic
+
+
+def topological_order(steps: list[dict]) -> list[str]:
+    """Return the task names sorted so that every task follows its dependencies
+
+    Args:
+        steps (list[dict]): steps with keys name and depends_on
+
+    Raises:
+        ValueError: Raises if the dependencies have a cycle
+
+    Returns:
+        list[str]: task names in execution order
+    """
+    pending = {step['name']: set(step['depends_on']) for step in steps}
+    order = []
+    ready = [name for name, deps in pending.items() if not deps]
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        del pending[name]
+        for other, deps in pending.items():
+            if name in deps:
+                deps.discard(name)
+                if not deps:
+                    ready.append(other)
+    if pending:
+        raise ValueError(f'Dependency cycle between tasks {sorted(pending)}!')
+    return order
+
+
+class StepTiming:
+    """
+    Timing of a scheduled task (monotonic seconds)
+    """
+    def __init__(self, name: str, depends_on: list[str]):
+        """ Constructor """
+        self.name = name
+        self.depends_on = depends_on
+        self.ready = 0.0
+        self.start = 0.0
+        self.end = 0.0
+        self.error = None
+
+    @property
+    def status(self) -> str:
+        """ PASS if completed, FAIL if raised an error, SKIP if not executed """
+        if self.error is not None:
+            return 'FAIL'
+        return 'PASS' if self.end else 'SKIP'
+
+    @property
+    def wait(self) -> float:
+        """ Time spent waiting a free worker after the dependencies were completed """
+        return self.start - self.ready
+
+    @property
+    def duration(self) -> float:
+        """ Time spent running """
+        return self.end - self.start
+
+
+class Schedule:
+    """
+    Timings of a sequence run and its report
+    """
+    def __init__(self, steps: list[dict]):
+        """ Constructor """
+        self.order = topological_order(steps)
+        self.timings = {step['name']: StepTiming(step['name'], step['depends_on']) for step in steps}
+        self.origin = monotonic()
+
+    def ready(self, name: str) -> None:
+        """ Dependencies of the task are completed """
+        self.timings[name].ready = monotonic()
+
+    def started(self, name: str) -> None:
+        """ Task got a worker """
+        self.timings[name].start = monotonic()
+
+    def completed(self, name: str) -> None:
+        """ Task is completed """
+        self.timings[name].end = monotonic()
+
+    def failed(self, name: str, error: BaseException) -> None:
+        """ Task raised an error, its run time ends now if it was started """
+        timing = self.timings[name]
+        timing.error = repr(error)
+        if timing.start and not timing.end:
+            timing.end = monotonic()
+
+    def tasks(self) -> list[dict]:
+        """Return status, wait and run time of every task
+
+        Returns:
+            list[dict]: task, status, wait, duration and error of each task in execution order
+        """
+        result = []
+        for name in self.order:
+            timing = self.timings[name]
+            done = bool(timing.end)
+            result.append({'task': name, 'status': timing.status, 'wait': timing.wait if done else None,
+                           'duration': timing.duration if done else None, 'error': timing.error})
+        return result
+
+    def critical_path(self) -> list[str]:
+        """Return the chain of tasks that bounded the sequence time
+
+        Starting from the last task completed, follows back the dependency completed last.
+
+        Returns:
+            list[str]: task names from the first to the last
+        """
+        done = [timing for timing in self.timings.values() if timing.end]
+        if not done:
+            return []
+        current = max(done, key=lambda timing: timing.end)
+        path = [current.name]
+        while current.depends_on:
+            current = max((self.timings[dep] for dep in current.depends_on), key=lambda timing: timing.end)
+            path.append(current.name)
+        path.reverse()
+        return path
+
+    def report(self) -> str:
+        """Return the report of the run: per task wait and run time, the critical path and the errors
+
+        Returns:
+            str: report text
+        """
+        width = max([len(name) for name in self.order] + [4])
+        lines = [f'{"Task":<{width}}  {"Start":>8}  {"Wait":>8}  {"Run":>8}']
+        for name in self.order:
+            timing = self.timings[name]
+            if not timing.end:
+                lines.append(f'{name:<{width}}  {"-":>8}  {"-":>8}  {"-":>8}')
+                continue
+            lines.append(f'{name:<{width}}  {timing.start - self.origin:8.3f}  {timing.wait:8.3f}  '
+                         f'{timing.duration:8.3f}')
+        lines.append(f'Critical path: {" -> ".join(self.critical_path())}')
+        lines.extend(f'Failed: {name}: {self.timings[name].error}' for name in self.order if self.timings[name].error)
+        return '\n'.join(lines)
@@ -0,0 +1,165 @@
+"""
+Helper function to measure the time spent in every step
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator
+
+
+class MemorySink:
+    """
+    Keep the spans in memory
+    """
+    def __init__(self):
+        """ Constructor """
+        self.records = []
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        """ Save a span """
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self) -> list[dict]:
+        """ Return and remove all the spans """
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+
+class PhaseStats:
+    """
+    Keep count, total and max time of every phase: the memory is bounded also for a whole shift
+    """
+    def __init__(self):
+        """ Constructor """
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        """ Add a span to the stats of its phase """
+        duration = record['duration']
+        with self._lock:
+            count, total, longest = self.phases.get(record['phase'], (0, 0.0, 0.0))
+            self.phases[record['phase']] = (count + 1, total + duration, max(longest, duration))
+
+    def clear(self) -> dict[str, tuple[int, float, float]]:
+        """ Return and reset the stats: count, total and max time by phase """
+        with self._lock:
+            phases, self.phases = self.phases, {}
+        return phases
+
+
+class JsonLinesSink:
+    """
+    Append the spans to a JSON-lines file: the spans are queued and written by a background thread
+    """
+    def __init__(self, filename: str):
+        """ Constructor """
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(filename, 'a', encoding='utf-8')                    # pylint: disable=consider-using-with
+        self._records = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self.__write_loop, name='timing-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: dict) -> None:
+        """ Save a span """
+        self._records.put(record)
+
+    def __write_loop(self) -> None:
+        """ Write the spans queued, a flush for each batch """
+        while True:
+            records = [self._records.get()]
+            while not self._records.empty() and records[-1] is not None:
+                records.append(self._records.get())
+            self._file.write(''.join(json.dumps(record, default=str) + '\n' for record in records
+                                     if record is not None))
+            self._file.flush()
+            if records[-1] is None:
+                return
+
+    def close(self) -> None:
+        """ Write the spans queued and close the file """
+        if self._thread.is_alive():
+            self._records.put(None)
+            self._thread.join()
+        self._file.close()
+
+
+class Tracer:
+    """
+    Send the timing spans to the sinks
+    """
+    def __init__(self):
+        """ Constructor """
+        self.sinks = []
+
+    def add_sink(self, sink: MemorySink|PhaseStats|JsonLinesSink) -> None:
+        """ Add a sink, it must have a write(record) method """
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink: MemorySink|PhaseStats|JsonLinesSink) -> None:
+        """ Remove a sink """
+        self.sinks.remove(sink)
+
+    @contextmanager
+    def span(self, phase: str, **fields) -> Iterator[dict]:
+        """Measure a block of code
+
+        The record yielded can be updated with other fields (e.g. exit_code).
+
+        Args:
+            phase (str): name of the step measured
+            fields: other fields of the record (e.g. task, serial)
+
+        Yields:
+            dict: record sent to the sinks at the end of the block
+        """
+        record = {'phase': phase, **fields}
+        if not self.sinks:
+            yield record
+            return
+        record['start'] = monotonic()
+        try:
+            yield record
+        except BaseException as ex:
+            record['error'] = repr(ex)
+            raise
+        finally:
+            record['end'] = monotonic()
+            record['duration'] = record['end'] - record['start']
+            for sink in self.sinks:
+                sink.write(record)
+
+
+tracer = Tracer()
+
+
+def summary(records: list[dict]|dict[str, tuple[int, float, float]]) -> str:
+    """Return a table with count, total, mean and max time of every phase
+
+    Args:
+        records (list[dict] | dict[str, tuple[int, float, float]]): spans, or stats by phase of PhaseStats
+
+    Returns:
+        str: summary table
+    """
+    phases = records
+    if isinstance(records, list):
+        phases = {}
+        for record in records:
+            count, total, longest = phases.get(record['phase'], (0, 0.0, 0.0))
+            phases[record['phase']] = (count + 1, total + record['duration'], max(longest, record['duration']))
+    width = max([len(phase) for phase in phases] + [5])
+    lines = [f'{"Phase":<{width}}  {"Count":>6}  {"Total":>9}  {"Mean":>9}  {"Max":>9}']
+    for phase, (count, total, longest) in sorted(phases.items(), key=lambda item: -item[1][1]):
+        lines.append(f'{phase:<{width}}  {count:6d}  {total:9.3f}  {total / count:9.3f}  {longest:9.3f}')
+    return '\n'.join(lines)
@@ -1,11 +1,16 @@
 """ Main file """
+import argparse
+import json
 import logging
-import logging.handlers
 import os
+import sys
 from enum import Enum
+from typing import Iterable, Iterator
 from helper.files import load_yaml, save_yaml, get_app_path
-from helper.load import load_task
+from helper.logs import log_context, setup_logging
+from helper.timing import JsonLinesSink, PhaseStats, summary, tracer
 
+STALL_SECONDS = 60                                                              # warn if no job is completed meanwhile
 
 def callback(status: Enum, msg: str):
     """ Call back funct """
@@ -19,7 +24,11 @@ def cnf_default() -> dict:
         dict: default configuration
     """
     _cnf = {
-        'log': {'filename': './log/pyTask.log', 'level': 'WARNING'}, 
+        'log': {'filename': './log/pyTask.log', 'level': 'WARNING', 'format': 'text'},
+        'timing': {'filename': None},
+        'plan_cache': './cache/plans',
+        'results': './log/results.sqlite',
+        'metrics': {'listen': None, 'snapshot': './log/metrics.prom', 'interval': 10},
     }
     return _cnf
 
@@ -41,36 +50,284 @@ def cnf_load(filename: str) -> dict:
 
 
 def log_init(log_cnf: dict) -> None:
-    """Logger initializatiob
+    """Logger initializatiob: records are queued and written by a background thread
 
     Args:
-        log_cnf (dict): Logger config
+        log_cnf (dict): Logger config (filename, level, format: text or json)
     """
-    logging.basicConfig(
-        format='%(asctime)s:%(levelname)-9s: %(message)s',
-        handlers=[logging.handlers.TimedRotatingFileHandler(filename=log_cnf['filename'], when='W0', interval=4)],
-        datefmt='%Y-%m-%d %H:%M:%S',
-        level=log_cnf['level'])
+    setup_logging(log_cnf)
+
+
+def timing_init(timing_cnf: dict|None) -> PhaseStats:
+    """Timing spans initialization
+
+    Args:
+        timing_cnf (dict | None): Timing config, with `filename` the spans are saved as JSON lines
+
+    Returns:
+        PhaseStats: stats by phase for the summary
+    """
+    sink = PhaseStats()
+    tracer.add_sink(sink)
+    if timing_cnf is not None and timing_cnf.get('filename'):
+        tracer.add_sink(JsonLinesSink(timing_cnf['filename']))
+    return sink
+
+
+def metrics_init(metrics_cnf: dict|None) -> bool:
+    """Live metrics initialization
+
+    Args:
+        metrics_cnf (dict | None): Metrics config, `listen` (HOST:PORT) for the HTTP `/metrics` endpoint and
+                                   `snapshot` for the file written every `interval` seconds
+
+    Returns:
+        bool: True if the metrics are exported
+    """
+    if metrics_cnf is None or not (metrics_cnf.get('listen') or metrics_cnf.get('snapshot')):
+        return False
+    from helper.metrics import metrics                                         # pylint: disable=import-outside-toplevel
+    if metrics_cnf.get('listen'):
+        host, port = metrics_cnf['listen'].rsplit(':', 1)
+        metrics.serve(host, int(port))
+    if metrics_cnf.get('snapshot'):
+        metrics.start_snapshot(metrics_cnf['snapshot'], metrics_cnf.get('interval') or 10)
+    return True
+
+
+def attached_units(config_path: str) -> Iterator[dict]:
+    """A device under test for every ST-LINK probe attached, the probe serial is used to program it
+
+    Args:
+        config_path (str): path where config files are saved
+
+    Returns:
+        Iterator[dict]: devices under test
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from tasks.utility import device_watcher, st_programmer
+    pgm_cnf = load_yaml(os.path.join(config_path, 'program_st_task.yml'))
+    programmer = st_programmer.STProgrammerFactory.get_instance(pgm_cnf['programmer'])
+    watcher = device_watcher.get_watcher(programmer, pgm_cnf.get('watch_interval') or 2.0)
+    return device_watcher.attached_units(watcher)
+
+
+def get_units(config_path: str, units: str) -> Iterable[dict]:
+    """Devices under test of the `--units` option
+
+    Args:
+        config_path (str): path where config files are saved
+        units (str): CSV file, "-" for stdin or "attach"
+
+    Returns:
+        Iterable[dict]: devices under test
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from helper.production import units_from_csv, units_from_stream
+    if units == 'attach':
+        return attached_units(config_path)
+    if units == '-':
+        return units_from_stream(sys.stdin)
+    return units_from_csv(units)
+
+
+def station_probes(config_path: str) -> list[str]:
+    """ST-LINK probes attached to this station, empty if the programmer is not available
+
+    Args:
+        config_path (str): path where config files are saved
+
+    Returns:
+        list[str]: probe serial numbers
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from tasks.utility import st_programmer
+    try:
+        pgm_cnf = load_yaml(os.path.join(config_path, 'program_st_task.yml'))
+        return st_programmer.STProgrammerFactory.get_instance(pgm_cnf['programmer']).get_device_list()
+    except Exception as ex:                                                     # pylint: disable=broad-exception-caught
+        logging.warning('No ST-LINK probes: %s', ex)
+        return []
+
+
+def run_coordinator(sequence: dict, config_path: str, opts: argparse.Namespace, results: str|None=None) -> None:
+    """Dispatch the devices under test to the workers connected and collect the results
+
+    Args:
+        sequence (dict): sequence loaded
+        config_path (str): path where config files are saved
+        opts (argparse.Namespace): command line options
+        results (str | None, optional): SQLite database of the unit results. Defaults to None.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from helper.distributed import Coordinator
+    host, port = opts.coordinator.rsplit(':', 1)
+    coordinator = Coordinator(host, int(port))
+    store = None
+    if results:
+        from helper.results import ResultStore                                 # pylint: disable=import-outside-toplevel
+        store = ResultStore(results)
+    def on_result(result: dict) -> None:
+        if store is not None:
+            store.add(result, sequence.get('Name'))
+        logging.info('Unit %s: %s in %.3f s by %s', result['unit'], result['status'], result['duration'],
+                     result['worker'])
+        print(json.dumps(result), flush=True)
+    coordinator.on_result = on_result
+    coordinator.start()
+    try:
+        for unit in get_units(config_path, opts.units or '-'):
+            coordinator.submit(sequence, unit)
+        done = 0
+        while not coordinator.join(STALL_SECONDS):
+            stats = coordinator.stats()
+            if stats['done'] == done:
+                logging.warning('No job completed in %d s: %d pending, %d running, workers %s', STALL_SECONDS,
+                                stats['pending'], stats['running'], [link['name'] for link in stats['workers']])
+            done = stats['done']
+        logging.info('Line stats: %s', json.dumps(coordinator.stats()))
+    finally:
+        coordinator.close()
+        if store is not None:
+            store.close()
+
+
+def run_worker(config_path: str, opts: argparse.Namespace) -> None:
+    """Run the jobs of a coordinator
+
+    Args:
+        config_path (str): path where config files are saved
+        opts (argparse.Namespace): command line options
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from helper.distributed import Worker
+    host, port = opts.worker.rsplit(':', 1)
+    worker = Worker(config_path, opts.name, station_probes(config_path), event=callback)
+    done = worker.run(host, int(port))
+    logging.info('Worker %s: %d jobs done', worker.name, done)
+
+
+def run_production(sequence: dict, config_path: str, opts: argparse.Namespace, results: str|None=None) -> None:
+    """Run the sequence for each device under test, tasks are loaded once
+
+    Args:
+        sequence (dict): sequence loaded
+        config_path (str): path where config files are saved
+        opts (argparse.Namespace): command line options
+        results (str | None, optional): SQLite database of the unit results. Defaults to None.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from helper.production import ProductionLoop
+    production = ProductionLoop(sequence, config_path, callback)
+    store = None
+    if results:
+        from helper.results import ResultStore                                 # pylint: disable=import-outside-toplevel
+        store = ResultStore(results)
+        production.on_result = lambda result: store.add(result, sequence.get('Name'))
+    try:
+        if opts.listen:
+            host, port = opts.listen.rsplit(':', 1)
+            production.serve(host, int(port))
+            return
+        for result in production.run(get_units(config_path, opts.units)):
+            logging.info('Unit %s: %s in %.3f s', result['unit'], result['status'], result['duration'])
+            print(json.dumps(result))
+    finally:
+        production.close()
+        if store is not None:
+            store.close()
 
-if __name__ == "__main__":
 
-    CNF_PATH = os.path.join(get_app_path(__file__), 'config')
-    CNF_FILE = os.path.join(CNF_PATH, 'pytask.yml')
-    SEQ_FILE = r'./sequences/test_seq_base.yml'
+def run_once(sequence: dict, config_path: str) -> bool:
+    """Run the sequence once and log the run report, also if a task fails
+
+    Args:
+        sequence (dict): sequence loaded
+        config_path (str): path where config files are saved
+
+    Returns:
+        bool: True if all the tasks passed
+    """
+    import asyncio                                                             # pylint: disable=import-outside-toplevel
+    # pylint: disable-next=import-outside-toplevel
+    from helper.runner import get_steps, run_sequence
+    from helper.scheduler import Schedule                                      # pylint: disable=import-outside-toplevel
+    schedule = Schedule(get_steps(sequence))
+    try:
+        asyncio.run(run_sequence(sequence, config_path, callback, schedule=schedule))
+    except Exception:                                                           # pylint: disable=broad-exception-caught
+        logging.exception('Sequence %s failed', sequence['Name'])
+    logging.info('Run report:\n%s', schedule.report())
+    return all(task['status'] == 'PASS' for task in schedule.tasks())
 
-    cnf = cnf_load(CNF_FILE)
+
+def main() -> None:
+    """ Main function """
+    cnf_path = os.path.join(get_app_path(__file__), 'config')
+    cnf_file = os.path.join(cnf_path, 'pytask.yml')
+
+    parser = argparse.ArgumentParser(description='pyTask sequence runner')
+    parser.add_argument('sequence', nargs='?', default=r'./sequences/test_seq_base.yml', help='sequence file')
+    parser.add_argument('--units', help='CSV file of the devices under test ("-" for stdin, a serial per line, '
+                                          '"attach" for every ST-LINK attached)')
+    parser.add_argument('--listen', metavar='HOST:PORT', help='receive the devices under test on a TCP socket')
+    parser.add_argument('--check', action='store_true', help='compile and validate the sequence, do not run it')
+    parser.add_argument('--coordinator', metavar='HOST:PORT',
+                        help='dispatch the devices under test of --units (default stdin) to the workers')
+    parser.add_argument('--worker', metavar='HOST:PORT', help='run the jobs of the coordinator')
+    parser.add_argument('--name', help='worker name (default host name and process id)')
+    opts = parser.parse_args()
+    # the modules of a run are imported only now: --help and wrong args do not wait them
+    # pylint: disable-next=import-outside-toplevel
+    from helper.metrics import metrics
+    # pylint: disable-next=import-outside-toplevel
+    from helper.plan import load_plan
+    # pylint: disable-next=import-outside-toplevel
+    from tasks.template_task import TaskBase
+
+    cnf = cnf_load(cnf_file)
     log_init(cnf['log'])
+    timings = timing_init(cnf.get('timing'))
 
     logging.info('Starting')
 
-    if SEQ_FILE is not None:
-        sequence = load_yaml(SEQ_FILE)
-        logging.info('Loaded sequence: %s', sequence["Name"])
-        logging.info('Description    : %s', sequence["Description"])
-        for task in sequence['Tasks']:
-            logging.info('Load: %s, module <%s>', task["task"], task["module"])
+    if opts.worker:
+        metrics_init(cnf.get('metrics'))
+        run_worker(cnf_path, opts)
+        metrics.stop()
+        logging.info('Timing summary:\n%s', summary(timings.clear()))
+        logging.info('Completed')
+        return
+
+    with tracer.span('sequence', file=opts.sequence):
+        try:
+            plan = load_plan(opts.sequence, cnf_path, cnf.get('plan_cache'))
+        except ValueError as ex:
+            logging.error('Invalid sequence %s: %s', opts.sequence, ex)
+            sys.exit(f'Invalid sequence "{opts.sequence}": {ex}')
+    if opts.check:
+        print(f'Sequence "{opts.sequence}" is valid')
+        return
+    TaskBase.preload(plan['configs'])
+    sequence = plan['sequence']
+    logging.info('Loaded sequence: %s', sequence["Name"])
+    logging.info('Description    : %s', sequence["Description"])
+    metrics_init(cnf.get('metrics'))
+    passed = True
+    with log_context(sequence=sequence['Name']):
+        if opts.coordinator:
+            run_coordinator(sequence, cnf_path, opts, cnf.get('results'))
+        elif opts.units or opts.listen:
+            run_production(sequence, cnf_path, opts, cnf.get('results'))
+        else:
+            passed = run_once(sequence, cnf_path)
+    metrics.stop()
+    logging.info('Timing summary:\n%s', summary(timings.clear()))
 
-            tsk = load_task(task["module"], CNF_PATH, task["args"], callback)
-            tsk.run()
+    logging.info('Completed')
+    if not passed:
+        sys.exit(1)
 
-        logging.info('Completed')
+
+if __name__ == "__main__":
+    main()
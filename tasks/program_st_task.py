@@ -5,10 +5,25 @@ Program device ST with ST LINK/PROGRAMMER
 from os import path
 from enum import Enum
 from pathlib import Path
-from time import sleep
 from typing import Callable
 from tasks.template_task import TaskBase
-from tasks.utility import st_programmer
+from tasks.utility import device_watcher, firmware, probe_pool, st_programmer
+from tasks.utility.st_programmer import STEvent
+
+FIRMWARE_SCHEMA = {
+    'file': {'type': str},
+    'addr': {'type': int},
+    'freq': {'type': int},
+    'prot': {'type': (int, str)},
+    'diff': {'type': (str, type(None)), 'required': False},
+}
+
+ARGS_SCHEMA = {
+    'loader': {'type': type(None)},
+    'bootloader': {'type': type(None)},
+    'fanout': {'type': bool, 'required': False},
+    'firmware': {'type': dict, 'schema': FIRMWARE_SCHEMA},
+}
 
 
 class ProgramSTDevice(TaskBase):
@@ -19,19 +34,90 @@ class ProgramSTDevice(TaskBase):
         """ Constructor """
         fullfilename = path.join( path.abspath(configpath), Path(__file__).stem + '.yml')
         super().__init__(fullfilename, on_event)
-        self.__st_pgm = st_programmer.STProgrammerFactory.get_instance(self._cnf['programmer'], on_event)
+        cache_file = None
+        if self._cnf.get('detect_cache', False):
+            cache_file = path.join(path.abspath(configpath), Path(__file__).stem + '.cache.json')
+        self.__st_pgm = st_programmer.STProgrammerFactory.get_instance(self._cnf['programmer'], on_event, cache_file)
+        self.__st_pgm.batch = self._cnf.get('batch', True)
+        self.__st_pgm.timeout = self._cnf.get('timeout', 300)
+        if self._cnf.get('watch_interval'):
+            self.__st_pgm.watcher = device_watcher.get_watcher(self.__st_pgm, self._cnf['watch_interval'])
+        self.__cache = None
+        if self._cnf.get('firmware_cache'):
+            self.__cache = firmware.get_cache(self._cnf['firmware_cache'])
+        self.__max_workers = self._cnf.get('max_workers')
+        self.__pool = None
+        if self._cnf.get('probe_pool', False):
+            self.__pool = probe_pool.get_pool(self.__st_pgm, self._cnf.get('max_failures', 3),
+                                              self._cnf.get('quarantine', 300))
+        self.__retries = self._cnf.get('retries', 1)
+        self.configure(args)
+
+    def configure(self, args: dict) -> None:
+        """ Firmware and options of the next run """
         if args['loader'] is not None:
             raise NotImplementedError
         if args['bootloader'] is not None:
             raise NotImplementedError
         self.__firmware = args['firmware']
+        if self.__firmware.get('diff'):
+            self.__firmware = dict(self.__firmware, sectors=self._cnf.get('sectors'),
+                                   flash_base=self._cnf.get('flash_base'))
+        self.__image = self.__firmware
+        self.__fanout = args.get('fanout', False)
+        self.results = {}
+
+    def set_event(self, on_event: Callable[[Enum, str], None]|None) -> None:
+        """ Callback of the task and of the programmer """
+        super().set_event(on_event)
+        self.__st_pgm.set_event(on_event)
+
+    def _init(self) -> None:
+        """ Use the binary image of a HEX firmware, parsed only once """
+        self.__image = self.__firmware
+        if path.isfile(self.__firmware['file']):
+            self._unit['firmware'] = firmware.digest(self.__firmware['file'])
+        if self.__cache is None or not self.__firmware['file'].lower().endswith('.hex'):
+            return
+        cached = self.__cache.get(self.__firmware['file'])
+        if cached is not None:
+            self.__image = dict(self.__firmware, file=cached[0], addr=cached[1])
 
     def _run(self) -> None:
         """ Run method """
-        self.__st_pgm.program(self.__firmware)
-        while self.__st_pgm.downloading:
-            sleep(5)
-            print('.', end='')
+        if self.__fanout:
+            self.__run_fanout()
+            return
+        if self.__pool is not None and not self._unit.get('probe'):
+            self.__run_pool()
+            return
+        st_pgm = self.__st_pgm
+        if self._unit.get('probe'):
+            st_pgm = self.__st_pgm.clone(self._unit['probe'])
+        done = st_pgm.program(self.__image).result()
+        if not done:
+            self._fail(f'Failed to program device: {st_pgm.last_error}', STEvent.ERROR)
+        elif callable(self._on_event):
+            self._on_event(STEvent.OK, 'Device programmed')
+
+    def __run_pool(self) -> None:
+        """ Program with a healthy probe of the pool, retry on another probe if it fails """
+        done, serials = self.__pool.program(self.__image, self.__retries, self.__st_pgm)
+        self.results = {'done': done, 'serials': serials}
+        if not done:
+            self._fail(f'Failed to program device with probes {serials}!', STEvent.ERROR)
+        elif callable(self._on_event):
+            self._on_event(STEvent.OK, f'[{serials[-1]}] Device programmed')
+
+    def __run_fanout(self) -> None:
+        """ Program all probes found at the same time and report the result of each serial """
+        self.results = self.__st_pgm.program_all(self.__image, self.__max_workers)
+        for serial, done in self.results.items():
+            if not done:
+                self._fail(f'[{serial}] Failed to program device: {self.__st_pgm.last_errors.get(serial, "")}',
+                           STEvent.ERROR)
+            elif callable(self._on_event):
+                self._on_event(STEvent.OK, f'[{serial}] Device programmed')
 
     def version(self) -> str:
         return "1.0.0"
@@ -2,11 +2,16 @@
 This is the template to must use in the PyTaskManage
 """
 
+import contextvars
+import copy
+import os
 from abc import abstractmethod
+from concurrent.futures import Executor
 from enum import Enum
 from typing import Callable
 import logging
 from helper.files import load_yaml
+from helper.timing import tracer
 
 class BaseStatus(Enum):
     """ Event type for callback func
@@ -19,6 +24,9 @@ class TaskBase:
     Task base abstract class
     """
     _cnf = {}
+    _preloaded = {}
+    execution = 'thread'                                # 'process': run in a worker process (see helper.isolation)
+    error = None                                        # error of the last run, the task is reported as failed
 
     def __init__(self, fullfilename: str|None=None, on_event: Callable[[BaseStatus, str], None]|None=None):
         """
@@ -26,19 +34,55 @@ class TaskBase:
         """
         if fullfilename is not None:
             logging.info('Load cnf %s', fullfilename)
-            self._cnf = load_yaml(fullfilename)
+            preloaded = TaskBase._preloaded.get(os.path.abspath(fullfilename))
+            self._cnf = copy.deepcopy(preloaded) if preloaded is not None else load_yaml(fullfilename)
         self._on_event = on_event
+        self._unit = {}
+
+    @classmethod
+    def preload(cls, configs: dict[str, dict]) -> None:
+        """ Config already loaded by full file name (e.g. from a compiled plan), used instead of the YAML files """
+        TaskBase._preloaded.update({os.path.abspath(name): cnf for name, cnf in configs.items()})
 
     @abstractmethod
     def version(self) -> str:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
 
+    def configure(self, args: dict) -> None:
+        """ Set the params of the next run: called by the constructor and before every run of a reused instance """
+        _ = args
+
+    def set_event(self, on_event: Callable[[BaseStatus, str], None]|None) -> None:
+        """ Set the callback function of the next run """
+        self._on_event = on_event
+
+    def set_unit(self, unit: dict) -> None:
+        """ Set the device under test of the next run (e.g. serial number) """
+        self._unit = unit
+
     def run(self) -> None:
         """ Run """
-        self._init()
-        self._run()
-        self._final()
+        task = type(self).__name__
+        self.error = None
+        with tracer.span('init', task=task):
+            self._init()
+        with tracer.span('run', task=task):
+            self._run()
+        with tracer.span('final', task=task):
+            self._final()
+
+    async def run_async(self, executor: Executor|None=None) -> None:
+        """ Run without blocking the event loop: the blocking run is offloaded to the executor """
+        import asyncio                                                         # pylint: disable=import-outside-toplevel
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, contextvars.copy_context().run, self.run)
+
+    def _fail(self, msg: str, status: Enum=BaseStatus.ERROR) -> None:
+        """ Report an error: the run is failed also if the task does not raise """
+        self.error = msg
+        if callable(self._on_event):
+            self._on_event(status, msg)
 
     def _init(self) -> None:
         """ Initialization before Run"""
@@ -0,0 +1,182 @@
+""" Live inventory of the ST-LINK probes attached, updated in background
+"""
+
+import logging
+import queue
+import sys
+import threading
+from typing import Callable, Iterator
+from tasks.utility.st_programmer import STProgrammer
+
+ST_VENDOR_ID = '0483'
+
+########################################################################################################################
+
+class DeviceWatcher:
+    """
+    Keep the list of the probes attached and publish attach/detach events
+
+    The probes are listed every `interval` seconds; on Linux with pyudev the list is also updated as soon as a ST
+    USB device is plugged or unplugged. If the listing fails the previous list is kept.
+    """
+    def __init__(self, programmer: STProgrammer, interval: float=2.0, use_udev: bool=True):
+        """
+        Constructor
+
+        Args:
+            programmer (STProgrammer): programmer of the CLI used to list the probes
+            interval (float, optional): polling seconds. Defaults to 2.0.
+            use_udev (bool, optional): use udev events on Linux if pyudev is installed. Defaults to True.
+        """
+        self._programmer = type(programmer)(programmer.fullfilename)         # own instance: no events to the tasks
+        self._interval = interval
+        self._use_udev = use_udev
+        self._devices = []
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._scanned = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def devices(self) -> list[str]:
+        """ Serials attached, waits the first scan """
+        self._scanned.wait()
+        with self._lock:
+            return list(self._devices)
+
+    @property
+    def running(self) -> bool:
+        """ True if the watcher is running """
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback: Callable[[str, str], None]) -> list[str]:
+        """
+        Add a callback of the events
+
+        Args:
+            callback (Callable[[str, str], None]): called with event ('attach' or 'detach') and serial
+
+        Returns:
+            list[str]: serials already attached, the callback gets only the changes after them
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            return list(self._devices)
+
+    def unsubscribe(self, callback: Callable[[str, str], None]) -> None:
+        """ Remove a callback of the events """
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def scan(self) -> None:
+        """ List the probes now and publish the changes """
+        try:
+            devices = self._programmer.get_device_list(strict=True)
+        except Exception as ex:                                                 # pylint: disable=broad-exception-caught
+            logging.warning('ST-LINK list failed, previous list kept: %r', ex)
+            self._scanned.set()
+            return
+        with self._lock:
+            attached = [serial for serial in devices if serial not in self._devices]
+            detached = [serial for serial in self._devices if serial not in devices]
+            self._devices = devices
+            subscribers = list(self._subscribers)
+        self._scanned.set()
+        for event, serials in (('detach', detached), ('attach', attached)):
+            for serial in serials:
+                logging.info('ST-LINK %s: %s', event, serial)
+                for callback in subscribers:
+                    try:
+                        callback(event, serial)
+                    except Exception:                                           # pylint: disable=broad-exception-caught
+                        logging.exception('Device watcher callback failed')
+
+    def start(self) -> 'DeviceWatcher':
+        """ Start the background thread """
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.__run, name='device-watcher', daemon=True)
+            self._thread.start()
+            if self._use_udev and sys.platform.startswith('linux'):
+                self.__start_udev()
+        return self
+
+    def stop(self) -> None:
+        """ Stop the background thread """
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __run(self) -> None:
+        """ Polling thread """
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception:                                                   # pylint: disable=broad-exception-caught
+                logging.exception('Device watcher scan failed')
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+
+    def __start_udev(self) -> None:
+        """ Scan as soon as a ST USB device is plugged or unplugged """
+        try:
+            import pyudev                                                      # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem='usb', device_type='usb_device')
+
+        def on_udev(device) -> None:
+            if device.get('ID_VENDOR_ID') == ST_VENDOR_ID:
+                self._wakeup.set()
+
+        observer = pyudev.MonitorObserver(monitor, callback=on_udev, name='device-watcher-udev')
+        observer.daemon = True
+        observer.start()
+
+
+def attached_units(watcher: DeviceWatcher) -> Iterator[dict]:
+    """
+    A device under test for every probe attached (e.g. fixture closed), for the production loop
+
+    The probes already attached come first: the events are subscribed now, not at the first device requested.
+
+    Args:
+        watcher (DeviceWatcher): watcher running
+
+    Returns:
+        Iterator[dict]: devices under test with the probe serial
+    """
+    events = queue.Queue()
+    for serial in watcher.subscribe(lambda event, serial: events.put(serial) if event == 'attach' else None):
+        events.put(serial)
+
+    def units() -> Iterator[dict]:
+        while True:
+            yield {'probe': events.get()}
+    return units()
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+def get_watcher(programmer: STProgrammer, interval: float=2.0) -> DeviceWatcher:
+    """
+    Return the watcher running of a programmer CLI, the same for every task
+
+    Args:
+        programmer (STProgrammer): programmer
+        interval (float, optional): polling seconds. Defaults to 2.0.
+
+    Returns:
+        DeviceWatcher: watcher running
+    """
+    with _watchers_lock:
+        key = programmer.fullfilename
+        if key not in _watchers:
+            _watchers[key] = DeviceWatcher(programmer, interval).start()
+        return _watchers[key]
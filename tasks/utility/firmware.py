@@ -0,0 +1,506 @@
+""" Firmware images: Intel HEX parsing, merging, CRC and cache of the converted binary images
+"""
+
+import binascii
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+
+########################################################################################################################
+
+class FirmwareImage:
+    """
+    Firmware image as list of contiguous segments
+    """
+    def __init__(self, segments: list[tuple[int, bytes]]):
+        """
+        Constructor
+
+        Args:
+            segments (list[tuple[int, bytes]]): address and data of each segment
+        """
+        self.segments = sorted(segments)
+
+    @property
+    def base(self) -> int:
+        """ Lowest address """
+        return self.segments[0][0] if self.segments else 0
+
+    @property
+    def end(self) -> int:
+        """ Highest address + 1 """
+        return max((addr + len(data) for addr, data in self.segments), default=0)
+
+    def to_bin(self, fill: int=0xFF, max_gap: int=0x10000) -> bytes|None:
+        """
+        Binary image from base to end, gaps are filled
+
+        Args:
+            fill (int, optional): value of gaps. Defaults to 0xFF (erased flash).
+            max_gap (int, optional): max gap between two segments. Defaults to 64 KiB.
+
+        Returns:
+            None: If the segments are too far apart (e.g. flash and option bytes)
+            bytes: binary image
+        """
+        if not self.segments:
+            return None
+        image = bytearray()
+        for addr, data in self.segments:
+            offset = addr - self.base
+            if offset > len(image):
+                if offset - len(image) > max_gap:
+                    return None
+                image.extend(bytes([fill]) * (offset - len(image)))
+            image[offset:offset + len(data)] = data
+        return bytes(image)
+
+    def read(self, addr: int, size: int, fill: int=0xFF) -> bytes:
+        """
+        Content of a memory region, gaps are filled
+
+        Args:
+            addr (int): address
+            size (int): bytes to read
+            fill (int, optional): value of gaps. Defaults to 0xFF (erased flash).
+
+        Returns:
+            bytes: region content
+        """
+        region = bytearray([fill]) * size
+        for seg_addr, data in self.segments:
+            begin, end = max(addr, seg_addr), min(addr + size, seg_addr + len(data))
+            if begin < end:
+                region[begin - addr:end - addr] = data[begin - seg_addr:end - seg_addr]
+        return bytes(region)
+
+    def crc32(self, addr: int|None=None, size: int|None=None, fill: int=0xFF) -> int:
+        """
+        CRC of the STM32 CRC unit over a memory region
+
+        Args:
+            addr (int | None, optional): address. Defaults to None (base).
+            size (int | None, optional): bytes. Defaults to None (up to end).
+            fill (int, optional): value of gaps. Defaults to 0xFF (erased flash).
+
+        Returns:
+            int: CRC
+        """
+        addr = self.base if addr is None else addr
+        size = self.end - addr if size is None else size
+        return crc32_stm32(self.read(addr, size, fill), fill)
+
+
+_SPACES = re.compile(rb'[ \t\r\n]*')
+
+def _run_length(text: bytes, pos: int, step: int, limit: int=4096) -> int:
+    """ Number of data records with the same size of the record at pos, found with strided slices of the text """
+    starts = text[pos:pos + step * limit:step]
+    length = len(starts) - len(starts.lstrip(b':'))
+    for offset, char in ((1, text[pos + 1:pos + 2]), (2, text[pos + 2:pos + 3]), (7, b'0'), (8, b'0')):
+        column = text[pos + offset:pos + step * length:step]
+        length = len(column) - len(column.lstrip(char))
+    return max(length, 1)
+
+
+def _checksums(raw: bytes, size: int, records: int) -> bytes:
+    """ Low byte of the sum of each record: the columns are added at once as lanes of a big integer """
+    width = 2 if size <= 257 else 3
+    total = 0
+    lanes = bytearray(width * records)
+    for column in range(size):
+        lanes[0::width] = raw[column::size]
+        total += int.from_bytes(lanes, 'little')
+    return total.to_bytes(width * records, 'little')[0::width]
+
+
+def _first_bad_record(block: bytes, step: int, size: int) -> int:
+    """ Index of the first record of a block that cannot be decoded """
+    for index in range(0, len(block), step):
+        record = block[index:index + step]
+        try:
+            if record[:1] != b':' or len(binascii.unhexlify(record[1:].translate(None, b' \t\r\n'))) != size:
+                return index // step
+        except binascii.Error:
+            return index // step
+    return len(block) // step
+
+
+def _normalize(text: bytes) -> bytes:
+    """ Same line end and no trailing spaces for all the records, so that they can be decoded in long runs """
+    crs = text.count(b'\r')
+    if crs in (0, text.count(b'\n')) and b' \r' not in text and b' \n' not in text and b'\t' not in text:
+        return text
+    return b'\n'.join(line.strip() for line in text.splitlines())
+
+
+def _parse_records(text: bytes, filename: str, verify: bool=True) -> FirmwareImage:
+    """
+    Decode the records of an Intel HEX text
+
+    Consecutive data records of the same size (and line end) are decoded at once: the run is converted from hex in one
+    call, the data is gathered with strided slices and the checksums are added by columns, so Python code runs only
+    for each run (e.g. 64 KiB between two extended address records) and not for each record. A run is cut before the
+    first record with a different line end (or trailing spaces), the next records start a new run; a text with mixed
+    line ends is normalized first, so that its runs are not cut at every record.
+    """
+    text = _normalize(text)
+    segments = []
+    upper = 0
+    pos = _SPACES.match(text).end()
+    num = 1
+
+    def add(addr: int, data: bytes) -> None:
+        if segments and segments[-1][0] + segments[-1][2] == addr:
+            segments[-1][1].append(data)
+            segments[-1][2] += len(data)
+        elif data:
+            segments.append([addr, [data], len(data)])
+
+    while pos < len(text):
+        try:
+            if text[pos:pos + 1] != b':':
+                raise ValueError
+            count = int(text[pos + 1:pos + 3], 16)
+        except ValueError as ex:
+            raise ValueError(f'Invalid record {num} of "{filename}"!') from ex
+        size = count + 5
+        step = _SPACES.match(text, pos + 2 * size + 1).end() - pos
+        records = _run_length(text, pos, step) if text[pos + 7:pos + 9] == b'00' else 1
+        block = text[pos:pos + records * step]
+        try:
+            raw = binascii.unhexlify(block.translate(None, b': \t\r\n'))
+        except binascii.Error:
+            raw = b''
+        if len(raw) != records * size or block.count(b':') != records:
+            bad = _first_bad_record(block, step, size)                          # e.g. a different line end
+            if not bad:
+                raise ValueError(f'Invalid record {num} of "{filename}"!')
+            records = bad
+            block = block[:records * step]
+            raw = binascii.unhexlify(block.translate(None, b': \t\r\n'))
+        if verify:
+            sums = _checksums(raw, size, records)
+            if sums.count(0) != records:
+                bad = next(index for index, value in enumerate(sums) if value)
+                raise ValueError(f'Checksum error at record {num + bad} of "{filename}"!')
+        rtype = raw[3]
+        if rtype == 0 and count:
+            addrs = bytearray(2 * records)
+            addrs[0::2] = raw[1::size]
+            addrs[1::2] = raw[2::size]
+            first = addrs[0] << 8 | addrs[1]
+            if first + records * count <= 0x10000 and \
+               addrs == struct.pack(f'>{records}H', *range(first, first + records * count, count)):
+                data = bytearray(records * count)
+                for column in range(count):
+                    data[column::count] = raw[4 + column::size]
+                add(upper + first, bytes(data))
+            else:
+                for offset in range(0, len(raw), size):
+                    add(upper + (raw[offset + 1] << 8 | raw[offset + 2]), raw[offset + 4:offset + 4 + count])
+        elif rtype == 1:
+            return FirmwareImage([(addr, b''.join(chunks)) for addr, chunks, _ in segments])
+        elif rtype == 2:
+            upper = int.from_bytes(raw[4:6], 'big') << 4
+        elif rtype == 4:
+            upper = int.from_bytes(raw[4:6], 'big') << 16
+        pos = _SPACES.match(text, pos + records * step).end()
+        num += records
+    raise ValueError(f'Missing end of file record in "{filename}"!')
+
+
+def parse_hex(filename: str, verify: bool=True) -> FirmwareImage:
+    """
+    Parse an Intel HEX file
+
+    Args:
+        filename (str): Intel HEX file
+        verify (bool, optional): check the checksum of every record. Defaults to True.
+
+    Raises:
+        ValueError: Raises if a record is not valid
+
+    Returns:
+        FirmwareImage: image parsed
+    """
+    with open(filename, 'rb') as file:
+        return _parse_records(file.read(), filename, verify)
+
+
+_validated = {}
+
+def validate_hex(filename: str) -> str|None:
+    """
+    Check the records of an Intel HEX file, checked again only if the file is changed
+
+    Args:
+        filename (str): Intel HEX file
+
+    Returns:
+        str | None: error message, None if the file is valid
+    """
+    info = os.stat(filename)
+    key = (os.path.abspath(filename), info.st_mtime_ns, info.st_size)
+    if key not in _validated:
+        try:
+            parse_hex(filename)
+            _validated[key] = None
+        except ValueError as ex:
+            _validated[key] = str(ex)
+    return _validated[key]
+
+
+def merge_images(images: list[FirmwareImage], overwrite: bool=False) -> FirmwareImage:
+    """
+    Merge images in one (e.g. bootloader and application), contiguous segments are joined
+
+    Args:
+        images (list[FirmwareImage]): images to merge
+        overwrite (bool, optional): data of the next images replace the overlapped data. Defaults to False.
+
+    Raises:
+        ValueError: Raises if two images overlap and overwrite is False
+
+    Returns:
+        FirmwareImage: merged image
+    """
+    segments = []
+    for image in images:
+        for addr, data in image.segments:
+            end = addr + len(data)
+            kept = []
+            for other, other_data in segments:
+                other_end = other + len(other_data)
+                if other_end <= addr or other >= end:
+                    kept.append((other, other_data))
+                    continue
+                if not overwrite:
+                    raise ValueError(f'Images overlap at 0x{max(addr, other):08X}!')
+                if other < addr:
+                    kept.append((other, other_data[:addr - other]))
+                if other_end > end:
+                    kept.append((end, other_data[end - other:]))
+            segments = kept + [(addr, data)]
+    joined = []
+    for addr, data in sorted(segments):
+        if joined and joined[-1][0] + len(joined[-1][1]) == addr:
+            joined[-1] = (joined[-1][0], joined[-1][1] + data)
+        else:
+            joined.append((addr, data))
+    return FirmwareImage(joined)
+
+
+_BITREV = bytes(int(f'{value:08b}'[::-1], 2) for value in range(256))
+
+def crc32_mpeg2(data: bytes) -> int:
+    """
+    CRC-32/MPEG-2 (polynomial 0x04C11DB7, init 0xFFFFFFFF, not reflected), computed by zlib on bit reversed bytes
+
+    Args:
+        data (bytes): data
+
+    Returns:
+        int: CRC
+    """
+    crc = zlib.crc32(bytes(data).translate(_BITREV)) ^ 0xFFFFFFFF
+    return int(f'{crc:032b}'[::-1], 2)
+
+
+def crc32_stm32(data: bytes, fill: int=0xFF) -> int:
+    """
+    CRC of the STM32 CRC unit with default settings over memory: 32-bit little endian words, so CRC-32/MPEG-2 of
+    the bytes of each word swapped
+
+    Args:
+        data (bytes): memory content, padded to a multiple of 4 bytes
+        fill (int, optional): value of the padding. Defaults to 0xFF (erased flash).
+
+    Returns:
+        int: CRC
+    """
+    data = bytes(data) + bytes([fill]) * (-len(data) % 4)
+    swapped = bytearray(len(data))
+    for index in range(4):
+        swapped[index::4] = data[3 - index::4]
+    return crc32_mpeg2(swapped)
+
+
+def patch(buffer: bytearray|memoryview|mmap.mmap, base: int, addr: int, data: bytes) -> None:
+    """
+    Write per unit data (e.g. serial number, calibration) into an image buffer in place
+
+    Args:
+        buffer (bytearray | memoryview | mmap.mmap): writable image (e.g. a mmap opened with ACCESS_COPY)
+        base (int): address of the first byte of the buffer
+        addr (int): address of the data
+        data (bytes): data to write
+
+    Raises:
+        ValueError: Raises if the data is outside the buffer
+    """
+    offset = addr - base
+    if offset < 0 or offset + len(data) > len(buffer):
+        raise ValueError(f'Patch at 0x{addr:08X} outside the image!')
+    buffer[offset:offset + len(data)] = data
+
+_digests = {}
+
+def digest(filename: str) -> str:
+    """
+    SHA-256 of a file, computed again only if the file is changed
+
+    Args:
+        filename (str): file
+
+    Returns:
+        str: hex digest
+    """
+    info = os.stat(filename)
+    key = (os.path.abspath(filename), info.st_mtime_ns, info.st_size)
+    if key not in _digests:
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        _digests[key] = sha.hexdigest()
+    return _digests[key]
+
+########################################################################################################################
+
+def _write_atomic(filename: str, data: bytes) -> None:
+    """ Write a file with a temporary file in the same folder and a rename, readers never see it partial """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), suffix='.tmp', delete=False) as file:
+        file.write(data)
+    try:
+        os.replace(file.name, filename)
+    except OSError:
+        os.remove(file.name)
+        raise
+
+_images = {}
+_images_lock = threading.Lock()
+
+def map_file(filename: str, writable: bool=False) -> mmap.mmap:
+    """
+    Memory mapped binary file, shared by all the boards while the file is not changed
+
+    Args:
+        filename (str): binary file, not empty
+        writable (bool, optional): a copy on write image for a board, to be patched: only the pages written are
+                                   copied and the file is not changed. Defaults to False.
+
+    Raises:
+        ValueError: Raises if the file is empty
+
+    Returns:
+        mmap.mmap: image, the shared one must not be closed
+    """
+    if writable:
+        with open(filename, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    info = os.stat(filename)
+    key = (info.st_mtime_ns, info.st_size)
+    fullfilename = os.path.abspath(filename)
+    with _images_lock:
+        if fullfilename not in _images or _images[fullfilename][0] != key:
+            with open(filename, 'rb') as file:
+                _images[fullfilename] = (key, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        return _images[fullfilename][1]
+
+########################################################################################################################
+
+class FirmwareCache:
+    """
+    Content addressed cache of the firmware converted to binary
+
+    The images are saved in the cache folder by SHA-256 of the source file and memory mapped for reuse. A firmware
+    that cannot be converted is saved too, with no base address, so it is parsed only once.
+    """
+    def __init__(self, cache_path: str):
+        """
+        Constructor
+
+        Args:
+            cache_path (str): folder where the binary images are saved
+        """
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> None|tuple[str, int]:
+        """
+        Binary image of a firmware file, parsed only the first time
+
+        Args:
+            filename (str): firmware file (.hex)
+
+        Returns:
+            None: If the firmware cannot be converted to a single binary image
+            tuple[str, int]: binary file and its base address
+        """
+        with self._lock:
+            sha = digest(filename)
+            binfile = os.path.join(self._cache_path, sha + '.bin')
+            infofile = os.path.join(self._cache_path, sha + '.json')
+            if os.path.isfile(infofile):
+                with open(infofile, 'r', encoding='utf-8') as file:
+                    base = json.load(file)['base']
+                if base is None:
+                    return None
+                if os.path.isfile(binfile):
+                    return binfile, base
+
+            image = parse_hex(filename)
+            data = image.to_bin()
+            info = {'source': os.path.basename(filename), 'base': None if data is None else image.base,
+                    'size': None if data is None else len(data)}
+            os.makedirs(self._cache_path, exist_ok=True)
+            if data is not None:
+                _write_atomic(binfile, data)
+            _write_atomic(infofile, json.dumps(info).encode('utf-8'))
+            return None if data is None else (binfile, image.base)
+
+    def open_image(self, filename: str, writable: bool=False) -> None|tuple[mmap.mmap, int]:
+        """
+        Memory mapped binary image of a firmware file, shared between all the boards
+
+        Args:
+            filename (str): firmware file (.hex)
+            writable (bool, optional): a copy on write image for a board, to be patched: only the pages written
+                                       are copied and the cached file is not changed. Defaults to False.
+
+        Returns:
+            None: If the firmware cannot be converted to a single binary image
+            tuple[mmap.mmap, int]: image and its base address
+        """
+        cached = self.get(filename)
+        if cached is None:
+            return None
+        binfile, base = cached
+        return map_file(binfile, writable), base
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(cache_path: str) -> FirmwareCache:
+    """
+    Return the cache of a folder, the same for every task
+
+    Args:
+        cache_path (str): folder where the binary images are saved
+
+    Returns:
+        FirmwareCache: firmware cache
+    """
+    cache_path = os.path.abspath(cache_path)
+    with _caches_lock:
+        if cache_path not in _caches:
+            _caches[cache_path] = FirmwareCache(cache_path)
+        return _caches[cache_path]
@@ -0,0 +1,224 @@
+""" Pool of ST-LINK probes with health tracking, quarantine and retry on another probe
+"""
+
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator
+from tasks.utility.st_programmer import STProgrammer
+
+########################################################################################################################
+
+class ProbeStats:
+    """
+    Health of a probe
+    """
+    def __init__(self, serial: str):
+        """ Constructor """
+        self.serial = serial
+        self.jobs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.total_time = 0.0
+        self.quarantined_until = 0.0
+        self.attached = True
+
+    @property
+    def failure_rate(self) -> float:
+        """ Failed jobs / jobs """
+        return self.failures / self.jobs if self.jobs else 0.0
+
+    @property
+    def mean_time(self) -> float:
+        """ Mean programming time in seconds """
+        return self.total_time / self.jobs if self.jobs else 0.0
+
+    def healthy(self, now: float) -> bool:
+        """ Probe attached and not in quarantine """
+        return self.attached and now >= self.quarantined_until
+
+    def as_dict(self) -> dict:
+        """ Statistics as dictionary """
+        return {'serial': self.serial, 'jobs': self.jobs, 'failures': self.failures,
+                'failure_rate': self.failure_rate, 'mean_time': self.mean_time,
+                'quarantined': self.quarantined_until > monotonic(), 'attached': self.attached}
+
+
+class ProbePool:
+    """
+    Lease the probes to the programming jobs
+
+    A probe that fails `max_failures` consecutive jobs is quarantined for `quarantine` seconds, a failed job is
+    retried on a different healthy probe.
+    """
+    def __init__(self, programmer: STProgrammer, max_failures: int=3, quarantine: float=300.0):
+        """
+        Constructor
+
+        Args:
+            programmer (STProgrammer): programmer used to list the probes and to clone the jobs
+            max_failures (int, optional): consecutive failures before quarantine. Defaults to 3.
+            quarantine (float, optional): quarantine seconds. Defaults to 300.0.
+        """
+        self._programmer = programmer
+        self._max_failures = max_failures
+        self._quarantine = quarantine
+        self._probes = {}
+        self._leased = set()
+        self._cond = threading.Condition()
+        if programmer.watcher is not None:
+            programmer.watcher.subscribe(lambda event, serial: self.refresh())
+
+    def refresh(self, serials: list[str]|None=None) -> None:
+        """
+        Update the probes attached
+
+        Args:
+            serials (list[str] | None, optional): serials attached. Defaults to None (listed by the programmer).
+        """
+        if serials is None:
+            watcher = self._programmer.watcher
+            serials = watcher.devices if watcher is not None and watcher.running else self._programmer.get_device_list()
+        with self._cond:
+            for probe in self._probes.values():
+                probe.attached = probe.serial in serials
+            for serial in serials:
+                self._probes.setdefault(serial, ProbeStats(serial))
+            self._cond.notify_all()
+
+    def _pick(self, exclude: set[str]) -> str|None:
+        """ Best free probe: healthy, lowest failure rate and mean time """
+        now = monotonic()
+        free = [probe for probe in self._probes.values()
+                if probe.serial not in self._leased and probe.serial not in exclude and probe.healthy(now)]
+        if not free:
+            return None
+        return min(free, key=lambda probe: (probe.failure_rate, probe.mean_time)).serial
+
+    def acquire(self, exclude: set[str]|None=None, timeout: float|None=None) -> str|None:
+        """
+        Lease a probe, wait if all the probes are busy
+
+        Args:
+            exclude (set[str] | None, optional): serials not to lease. Defaults to None.
+            timeout (float | None, optional): max seconds to wait. Defaults to None (forever).
+
+        Returns:
+            str|None: serial, None if no probe is available (no healthy probe or timeout)
+        """
+        exclude = exclude or set()
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            if not self._probes:
+                self.refresh()
+            while True:
+                serial = self._pick(exclude)
+                if serial is not None:
+                    self._leased.add(serial)
+                    return serial
+                now = monotonic()
+                candidates = [probe for probe in self._probes.values()
+                              if probe.serial not in exclude and probe.attached]
+                if not any(probe.serial in self._leased or probe.healthy(now) for probe in candidates):
+                    return None
+                if deadline is not None and now >= deadline:
+                    return None
+                self._cond.wait(None if deadline is None else deadline - now)
+
+    def release(self, serial: str, done: bool, duration: float) -> None:
+        """
+        Return a probe with the job result
+
+        Args:
+            serial (str): serial leased
+            done (bool): True if the job is completed
+            duration (float): job seconds
+        """
+        with self._cond:
+            self._leased.discard(serial)
+            probe = self._probes.setdefault(serial, ProbeStats(serial))
+            probe.jobs += 1
+            probe.total_time += duration
+            if done:
+                probe.consecutive_failures = 0
+            else:
+                probe.failures += 1
+                probe.consecutive_failures += 1
+                if probe.consecutive_failures >= self._max_failures:
+                    probe.quarantined_until = monotonic() + self._quarantine
+                    probe.consecutive_failures = 0
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, exclude: set[str]|None=None, timeout: float|None=None) -> Iterator[dict]:
+        """
+        Lease a probe for a block of code, the job result is the `done` key of the lease
+
+        Raises:
+            SystemError: Raises if no probe is available
+
+        Yields:
+            dict: lease with serial and done (default False)
+        """
+        serial = self.acquire(exclude, timeout)
+        if serial is None:
+            raise SystemError('No healthy ST-LINK-Vx available!')
+        lease = {'serial': serial, 'done': False}
+        start = monotonic()
+        try:
+            yield lease
+        finally:
+            self.release(serial, lease['done'], monotonic() - start)
+
+    def program(self, firmware: dict, retries: int=1, programmer: STProgrammer|None=None) -> tuple[bool, list[str]]:
+        """
+        Program a device, a failed job is retried on another healthy probe
+
+        Args:
+            firmware (dict): firmware description (file, addr, freq, prot)
+            retries (int, optional): retries on other probes. Defaults to 1.
+            programmer (STProgrammer | None, optional): programmer of the caller, cloned for each probe with its
+                                                        callback and options. Defaults to None (the one of the pool).
+
+        Returns:
+            tuple[bool, list[str]]: result and serials used
+        """
+        programmer = programmer or self._programmer
+        tried = []
+        for _ in range(retries + 1):
+            try:
+                with self.lease(set(tried)) as lease:
+                    tried.append(lease['serial'])
+                    lease['done'] = programmer.clone(lease['serial']).program_wait(firmware)
+            except SystemError:
+                break
+            if lease['done']:
+                return True, tried
+        return False, tried
+
+    def stats(self) -> list[dict]:
+        """ Statistics of every probe """
+        with self._cond:
+            return [probe.as_dict() for probe in self._probes.values()]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(programmer: STProgrammer, max_failures: int=3, quarantine: float=300.0) -> ProbePool:
+    """
+    Return the pool of a programmer CLI, the same for every task so the probe health is kept between units
+
+    Args:
+        programmer (STProgrammer): programmer
+        max_failures (int, optional): consecutive failures before quarantine. Defaults to 3.
+        quarantine (float, optional): quarantine seconds. Defaults to 300.0.
+
+    Returns:
+        ProbePool: pool
+    """
+    with _pools_lock:
+        key = programmer.fullfilename
+        if key not in _pools:
+            _pools[key] = ProbePool(programmer, max_failures, quarantine)
+        return _pools[key]
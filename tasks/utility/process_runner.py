@@ -0,0 +1,116 @@
+""" Run a CLI reading its output while it runs: progress, error markers and timeout
+"""
+
+import re
+import subprocess
+import threading
+from typing import Callable
+
+PROGRESS = re.compile(rb'(\d{1,3}(?:\.\d+)?)\s?%')
+
+########################################################################################################################
+
+class ProcessResult:
+    """
+    Result of a process run
+    """
+    def __init__(self, args: list[str]):
+        """ Constructor """
+        self.args = args
+        self.returncode = None
+        self.lines = []
+        self.errors = []
+        self.progress = 0
+        self.timed_out = False
+
+    @property
+    def output(self) -> str:
+        """ Output of the process, progress updates excluded """
+        return '\n'.join(self.lines)
+
+    def check(self) -> str:
+        """
+        Return the output if the process is completed successfully
+
+        Raises:
+            subprocess.TimeoutExpired: Raises if the process was killed by timeout
+            subprocess.CalledProcessError: Raises if the exit code is not 0
+
+        Returns:
+            str: output
+        """
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.args, 0, self.output)
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.args, self.output)
+        return self.output
+
+
+def run_process(args: list[str], timeout: float|None=None, on_progress: Callable[[int], None]|None=None,
+                error_markers: tuple[str, ...]=('Error',), stop_on_error: bool=False) -> ProcessResult:
+    """
+    Run a process and read its output line by line while it runs
+
+    Progress percentages (also the ones updated with carriage return) are forwarded as soon as they change, the
+    lines with an error marker are collected. If the timeout expires the process is killed.
+
+    Args:
+        args (list[str]): command line
+        timeout (float | None, optional): max seconds. Defaults to None (no timeout).
+        on_progress (Callable[[int], None] | None, optional): progress callback. Defaults to None.
+        error_markers (tuple[str, ...], optional): text of the error lines. Defaults to ('Error',).
+        stop_on_error (bool, optional): kill the process at the first error line. Defaults to False.
+
+    Returns:
+        ProcessResult: result
+    """
+    result = ProcessResult(args)
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL) as proc:
+
+        def read() -> None:
+            pending = b''
+            while True:
+                chunk = proc.stdout.read1(4096)
+                if not chunk:
+                    break
+                pending += chunk
+                *parts, pending = re.split(rb'(\r\n|\n|\r)', pending)
+                for part, end in zip(parts[::2], parts[1::2]):
+                    if part or end != b'\r':
+                        parse(part, True)
+                if pending:
+                    parse(pending, False)
+            if pending:
+                parse(pending, True)
+
+        def parse(raw: bytes, completed: bool) -> None:
+            match = None
+            for match in PROGRESS.finditer(raw):
+                pass
+            if match is not None:
+                value = min(int(float(match.group(1))), 100)
+                if value != result.progress:
+                    result.progress = value
+                    if callable(on_progress):
+                        on_progress(value)
+            if not completed:
+                return
+            line = raw.decode('utf-8', errors='ignore').rstrip()
+            error = any(marker in line for marker in error_markers)
+            if error:
+                result.errors.append(line)
+                if stop_on_error:
+                    proc.kill()
+            if match is None or error:
+                result.lines.append(line)
+
+        reader = threading.Thread(target=read, name='process-reader', daemon=True)
+        reader.start()
+        try:
+            result.returncode = proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            result.timed_out = True
+            proc.kill()
+            result.returncode = proc.wait()
+        reader.join()
+    return result
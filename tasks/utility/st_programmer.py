@@ -1,12 +1,25 @@
 """ ST LINK/PRPOGRAMMER
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
 from ctypes import ArgumentError
 from enum import Enum
-from os.path import isfile, abspath
+from os import stat
+from os.path import isfile, abspath, join, splitext
+import json
+import tempfile
 import threading
-import subprocess
+from time import monotonic
 from typing import Callable
+from helper.logs import set_context
+from helper.metrics import flash_seconds
+from helper.timing import tracer
+from tasks.utility.firmware import map_file, validate_hex
+from tasks.utility.process_runner import ProcessResult, run_process
+
+VERSION_TIMEOUT = 10                                                            # seconds to get the CLI version
+LIST_TIMEOUT = 30                                                               # seconds to list the probes
 
 ########################################################################################################################
 
@@ -15,16 +28,24 @@ class STEvent(Enum):
     """
     OK = 0
     ERROR = -1
+    PROGRESS = 1
 
 
 class STProgrammer:
     """
     Abstract Class
+
+    With `batch` (default) the device is programmed with a single CLI call and SWD connection.
+    Every CLI call is killed after `timeout` seconds, the progress is notified as STEvent.PROGRESS event.
     """
     _fullfilename = None
     _serial = ''
     _downloading = False
+    _last_error = ''
     _on_event = None
+    batch = True
+    timeout = 300
+    watcher = None
 
     def __init__(self, fullfilename: str, on_event: Callable[[STEvent, str], None]|None=None):
         """
@@ -39,6 +60,16 @@ class STProgrammer:
         """
         self._fullfilename = fullfilename
         self._on_event = on_event
+        self._last_errors = {}
+
+    def set_event(self, on_event: Callable[[STEvent, str], None]|None) -> None:
+        """
+        Set the callback event
+
+        Args:
+            on_event (Callable[[STEvent, str], None]|None): Callback event
+        """
+        self._on_event = on_event
 
     def auto_select_device(self) -> None:
         """
@@ -50,19 +81,48 @@ class STProgrammer:
         Returns:
             None
         """
-        devices = self.get_device_list()
+        with tracer.span('discovery'):
+            devices = self.__devices()
         if len(devices) == 0:
             raise SystemError('ST-LINK-Vx not found!')
         if len(devices) > 1:
             raise SystemError('Too many ST-LINK-Vx found!')
         self._serial = devices[0]
 
+    def __devices(self) -> list[str]:
+        """ Devices from the watcher if it is running, else listed by the CLI """
+        if self.watcher is not None and self.watcher.running:
+            return self.watcher.devices
+        return self.get_device_list()
+
+    def clone(self, serial: str) -> 'STProgrammer':
+        """
+        Create a new programmer of the same type bound to a serial
+
+        Args:
+            serial (str): ST-LINK-Vx serial number
+
+        Returns:
+            STProgrammer: new programmer, events are prefixed with the serial
+        """
+        on_event = None
+        if callable(self._on_event):
+            parent_event = self._on_event
+            def on_event(status: STEvent, msg: str) -> None:
+                parent_event(status, f'[{serial}] {msg}')
+        probe = type(self)(self._fullfilename, on_event)
+        probe._serial = serial
+        probe.batch = self.batch
+        probe.timeout = self.timeout
+        probe.watcher = self.watcher
+        return probe
+
     @classmethod
     def get_version(cls, fullfilename: str) -> None|str:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
 
-    def get_device_list(self) -> list[str]:
+    def get_device_list(self, strict: bool=False) -> list[str]:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
 
@@ -74,38 +134,206 @@ class STProgrammer:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
 
-    def program(self, firmware: dict) -> None:
-        """ Programming device via Thread
+    def program(self, firmware: dict) -> Future:
         """
+        Programming device via Thread
+
+        Args:
+            firmware (dict): firmware description (file, addr, freq, prot)
+
+        Returns:
+            Future: completed as soon as the thread ends, the result is True if device is programmed.
+                    Any exception raised by the thread is set on the future.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._downloading = True
+        threading.Thread(target=contextvars.copy_context().run, args=(self.__worker, future, firmware)).start()
+        return future
+
+    def __worker(self, future: Future, firmware: dict) -> None:
+        """ Programming thread: forward the result to the future """
+        try:
+            future.set_result(self.program_wait(firmware))
+        except Exception as ex:                                                 # pylint: disable=broad-exception-caught
+            self._last_error = str(ex)
+            future.set_exception(ex)
+        finally:
+            self._downloading = False
+
+    def program_wait(self, firmware: dict) -> bool:
+        """
+        Programming device and wait the end
+
+        With `diff` in the firmware a binary file is compared with the flash read back: `skip` does not program
+        an identical device, `sectors` programs only the sectors that differ (sizes of the flash sectors in
+        `sectors`, first sector at `flash_base`). If the flash cannot be read the whole device is programmed.
+
+        Args:
+            firmware (dict): firmware description (file, addr, freq, prot, optional diff, sectors, flash_base)
+
+        Returns:
+            bool: True if device is programmed
+        """
+        self._last_error = ''
         fullfilename = abspath(firmware['file'])
-        threading.Thread(target=self.__run, args=(fullfilename,
-                                                  firmware['addr'],
-                                                  firmware['freq'],
-                                                  firmware['prot'])).start()
+        if self._serial:
+            set_context(serial=self._serial)
+        done = False
+        start = monotonic()
+        try:
+            with tracer.span('program', serial=self._serial) as span:
+                done = self.__run(fullfilename, firmware['addr'], firmware['freq'], firmware['prot'],
+                                  firmware.get('diff'), firmware.get('sectors'), firmware.get('flash_base'))
+                span['serial'] = self._serial
+                span['result'] = done
+        finally:
+            flash_seconds.observe(monotonic() - start, probe=self._serial or '', result='ok' if done else 'fail')
+        return done
+
+    def program_all(self, firmware: dict, max_workers: int|None=None) -> dict[str, bool]:
+        """
+        Programming all ST-LINK-Vx devices found, one worker for each probe
+
+        Args:
+            firmware (dict): firmware description (file, addr, freq, prot)
+            max_workers (int | None, optional): max probes programmed at the same time. Defaults to None (all).
+
+        Returns:
+            dict[str, bool]: programming result for each serial, the errors are in `last_errors`
+        """
+        self._last_errors = {}
+        with tracer.span('discovery'):
+            devices = self.__devices()
+        if len(devices) == 0:
+            raise SystemError('ST-LINK-Vx not found!')
+        if max_workers is None or max_workers > len(devices):
+            max_workers = len(devices)
+        probes = [self.clone(serial) for serial in devices]
+
+        def program(probe: STProgrammer, ctx: contextvars.Context) -> bool:
+            try:
+                return ctx.run(probe.program_wait, firmware)
+            except Exception as ex:                                             # pylint: disable=broad-exception-caught
+                probe._error(repr(ex))
+                return False
+
+        self._downloading = True
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='st-probe') as pool:
+                contexts = [contextvars.copy_context() for _ in probes]
+                results = dict(zip(devices, pool.map(program, probes, contexts)))
+            self._last_errors = {probe.serial: probe.last_error for probe in probes if not results[probe.serial]}
+            return results
+        finally:
+            self._downloading = False
 
     @property
     def downloading(self) -> bool:
         """ Get if downolad is running"""
         return self._downloading
 
+    @property
+    def fullfilename(self) -> str:
+        """ Get full file name of the CLI """
+        return self._fullfilename
+
     @property
     def serial(self) -> str:
         """ Get serial"""
         return self._serial
 
+    @property
+    def last_error(self) -> str:
+        """ Get last error of the programming """
+        return self._last_error
+
+    @property
+    def last_errors(self) -> dict[str, str]:
+        """ Get the error of each serial failed in the last `program_all` """
+        return self._last_errors
+
+    def _error(self, msg: str) -> None:
+        """ Save the error and notify it """
+        self._last_error = msg
+        if callable(self._on_event):
+            self._on_event(STEvent.ERROR, msg)
+
     def _check_file(self, filename: str, exts: list[str]) -> bool:
-        """ Check if file exists and the correct extension
+        """ Check if file exists, the correct extension and the records of a HEX file (checked once for each file)
         """
         if not isfile(filename):
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Failed to find file "{filename}"!')
+            self._error(f'Failed to find file "{filename}"!')
             return False
-        if not filename[-4:] in exts:
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Error to check extension "{exts}" in file "{filename}"!')
+        if not splitext(filename)[1].lower() in exts:
+            self._error(f'Error to check extension "{exts}" in file "{filename}"!')
             return False
+        if splitext(filename)[1].lower() == '.hex':
+            error = validate_hex(filename)
+            if error is not None:
+                self._error(error)
+                return False
         return True
 
+    def _exec(self, args: list[str], timeout: float|None=None) -> str:
+        """
+        Run the CLI and return its output
+
+        Args:
+            args (list[str]): command line args
+            timeout (float | None, optional): max seconds. Defaults to None (`timeout` of the programmer).
+
+        Raises:
+            subprocess.CalledProcessError: Raises if the CLI fails
+            subprocess.TimeoutExpired: Raises if the CLI is killed by timeout
+
+        Returns:
+            str: CLI output
+        """
+        return self.__run_cli(args, timeout).check()
+
+    def _exec_errors(self, args: list[str]) -> list[str]:
+        """
+        Run a CLI operation, the CLI is stopped at the first error line
+
+        Args:
+            args (list[str]): command line args
+
+        Raises:
+            subprocess.CalledProcessError: Raises if the CLI fails without error lines
+            subprocess.TimeoutExpired: Raises if the CLI is killed by timeout
+
+        Returns:
+            list[str]: error lines of the CLI, empty if the operation is completed
+        """
+        res = self.__run_cli(args, None, True)
+        if res.errors:
+            return res.errors
+        res.check()
+        return []
+
+    def __run_cli(self, args: list[str], timeout: float|None, stop_on_error: bool=False) -> ProcessResult:
+        """ Run the CLI with a span, the timeout is notified """
+        if timeout is None:
+            timeout = self.timeout
+        operation = next((arg for arg in args if arg.startswith('-') and arg != '-c'), '')
+        with tracer.span('cli', serial=self._serial, operation=operation) as span:
+            res = run_process([self._fullfilename] + args, timeout, self.__progress, stop_on_error=stop_on_error)
+            span['exit_code'] = res.returncode
+            span['timed_out'] = res.timed_out
+        if res.timed_out:
+            self._error(f'CLI "{operation}" killed after {timeout} s!')
+        return res
+
+    def __progress(self, value: int) -> None:
+        """ Notify the CLI progress """
+        if callable(self._on_event):
+            self._on_event(STEvent.PROGRESS, f'{value}%')
+
+    def _connect_args(self, freq: int) -> list[str]:
+        """ Abstract method """
+        raise NotImplementedError('This is an abstract method')
+
     def _erase_sector(self, freq: int, sect: int=1) -> bool:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
@@ -114,19 +342,97 @@ class STProgrammer:
         """ Abstract method """
         raise NotImplementedError('This is an abstract method')
 
-    def __run(self, filename: str, addr: int, freq: int, prot: int):
+    def _program_batch(self, firmware: str, freq: int, addr: int, prot: int) -> bool:
+        """ Abstract method """
+        raise NotImplementedError('This is an abstract method')
+
+    def _upload(self, freq: int, addr: int, size: int, filename: str) -> bool:
+        """ Abstract method """
+        raise NotImplementedError('This is an abstract method')
+
+    def _program_sectors(self, freq: int, sectors: list[int], chunks: list[tuple[str, int]], prot: int) -> bool:
+        """ Abstract method """
+        raise NotImplementedError('This is an abstract method')
+
+    def _read_memory(self, freq: int, addr: int, size: int) -> bytes|None:
+        """ Read back the device memory, None if the device cannot be read (e.g. protected) """
+        with tempfile.TemporaryDirectory() as folder:
+            filename = join(folder, 'upload.bin')
+            try:
+                if not self._upload(freq, addr, size, filename) or not isfile(filename):
+                    return None
+            except NotImplementedError:
+                return None
+            with open(filename, 'rb') as file:
+                data = file.read()
+        return data if len(data) == size else None
+
+    def __diff_sectors(self, image: bytes, addr: int, target: bytes, sectors: list[int]|None,
+                       flash_base: int|None) -> list[tuple[int, int, int]]:
+        """ Return sector index, start and end offset in the image of each sector that differs """
+        if not sectors:
+            return [] if image[:] == target else [(-1, 0, len(image))]
+        diff = []
+        start = addr if flash_base is None else flash_base
+        for index, size in enumerate(sectors):
+            begin, end = max(start, addr) - addr, min(start + size, addr + len(image)) - addr
+            start += size
+            if begin < end and image[begin:end] != target[begin:end]:
+                diff.append((index, begin, end))
+        return diff
+
+    def __run_diff(self, filename: str, addr: int, freq: int, prot: int, mode: str,
+                   sectors: list[int]|None, flash_base: int|None) -> None|bool:
+        """ Compare and program only if needed, None if the whole device must be programmed """
+        if splitext(filename)[1].lower() != '.bin':
+            return None
+        if stat(filename).st_size == 0:
+            self._error(f'Empty firmware file "{filename}"!')
+            return False
+        image = map_file(filename)                                             # shared by the boards, not closed
+        target = self._read_memory(freq, addr, len(image))
+        if target is None:
+            return None
+        diff = self.__diff_sectors(image, addr, target, sectors, flash_base)
+        if not diff:
+            if callable(self._on_event):
+                self._on_event(STEvent.OK, 'Firmware already programmed')
+            if str(prot) in ['0', '170', '0xAA']:
+                return True
+            return self.set_readout_protection_level(prot)
+        if mode != 'sectors' or diff[0][0] < 0:
+            return None
+        with tempfile.TemporaryDirectory() as folder:
+            chunks = []
+            for index, begin, end in diff:
+                chunk = join(folder, f'sector{index}.bin')
+                with open(chunk, 'wb') as file:
+                    file.write(image[begin:end])
+                chunks.append((chunk, addr + begin))
+            return self._program_sectors(freq, [index for index, _, _ in diff], chunks, prot)
+
+    def __run(self, filename: str, addr: int, freq: int, prot: int, diff: str|None=None,
+              sectors: list[int]|None=None, flash_base: int|None=None) -> bool:
         """ Programming thread
         """
         self._downloading = True
         try:
             if not self._check_file(filename, ['.bin', '.hex']):
-                return
+                return False
 
             if self._serial == '':
                 self.auto_select_device()
 
+            if diff:
+                done = self.__run_diff(filename, addr, freq, prot, diff, sectors, flash_base)
+                if done is not None:
+                    return done
+
+            if self.batch:
+                return self._program_batch(filename, freq, addr, prot)
+
             if not self.set_readout_protection_level(170):      # set to 0xAA
-                return
+                return False
 
             # if firmware != loader:
             #     if not self._erase_sector(firmware['freq'], 1):
@@ -134,9 +440,10 @@ class STProgrammer:
             #     time.sleep(1)
 
             if not self._download_file(filename, freq, addr):
-                return
+                return False
             if not self.set_readout_protection_level(prot):
-                return
+                return False
+            return True
         finally:
             self._downloading = False
 
@@ -153,25 +460,86 @@ class STProgrammerFactory:
         """
         raise NotImplementedError('Use "get_instance" class method!')
 
+    _detected = {}
+    _lock = threading.Lock()
+
     @classmethod
-    def get_instance(cls, fullfilename: str, on_event: Callable[[Enum, str], None]|None=None) -> STProgrammer:
+    def get_instance(cls, fullfilename: str, on_event: Callable[[Enum, str], None]|None=None,
+                     cache_file: str|None=None) -> STProgrammer:
         """
         Factory get method
 
+        The detected programmer is cached by path, modification time and size of the executable.
+
         Args:
             fullfilename (str): Full path name of ST LINK/PROGRAMMER
+            on_event (Callable[[Enum, str], None] | None, optional): Callback event. Defaults to None.
+            cache_file (str | None, optional): JSON file where the detection is saved. Defaults to None.
 
         Returns:
             STProgrammer: ST LINK/PROGRAMMER Class
         """
+        detected = cls.detect(fullfilename, cache_file)
+        if detected is None:
+            raise NotImplementedError(f'Unable to find "{fullfilename}" !')
+        programmers = {'STLink': STLink, 'STM32Programmer': STM32Programmer}
+        return programmers[detected[0]](fullfilename, on_event)
 
-        if STLink.get_version(fullfilename) is not None:
-            return STLink(fullfilename, on_event)
+    @classmethod
+    def detect(cls, fullfilename: str, cache_file: str|None=None) -> None|tuple[str, str]:
+        """
+        Detect the programmer type, the CLI is called only if the executable is not in cache
 
-        if STM32Programmer.get_version(fullfilename) is not None:
-            return STM32Programmer(fullfilename, on_event)
+        Args:
+            fullfilename (str): Full path name of ST LINK/PROGRAMMER
+            cache_file (str | None, optional): JSON file where the detection is saved. Defaults to None.
 
-        raise NotImplementedError(f'Unable to find "{fullfilename}" !')
+        Returns:
+            None: If fullfilename doesn't exist or is not a ST LINK/PROGRAMMER
+            tuple[str, str]: class name and version
+        """
+        if not isfile(fullfilename):
+            return None
+        info = stat(fullfilename)
+        key = f'{abspath(fullfilename)}|{info.st_mtime_ns}|{info.st_size}'
+        with cls._lock:
+            if key not in cls._detected and cache_file is not None:
+                cls._detected.update(cls.__load_cache(cache_file))
+            if key in cls._detected:
+                return tuple(cls._detected[key])
+
+        detected = None
+        for programmer in (STLink, STM32Programmer):
+            version = programmer.get_version(fullfilename)
+            if version is not None:
+                detected = (programmer.__name__, version)
+                break
+        if detected is None:
+            return None
+
+        with cls._lock:
+            cls._detected[key] = detected
+            if cache_file is not None:
+                cls.__save_cache(cache_file)
+        return detected
+
+    @classmethod
+    def __load_cache(cls, cache_file: str) -> dict:
+        """ Load detection cache file """
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @classmethod
+    def __save_cache(cls, cache_file: str) -> None:
+        """ Save detection cache file """
+        try:
+            with open(cache_file, 'w', encoding='utf-8') as file:
+                json.dump(cls._detected, file, indent=2)
+        except OSError:
+            pass
 
     @classmethod
     def version(cls) -> str:
@@ -199,45 +567,38 @@ class STLink(STProgrammer):
         if not isfile(fullfilename):
             return None
         try:
-            return subprocess.check_output(f"{fullfilename } -v").decode('utf-8').splitlines()[0]
+            return run_process([fullfilename, '-v'], VERSION_TIMEOUT).check().splitlines()[0]
         except Exception:                                                       # pylint: disable=broad-exception-caught
             return None
 
-    def get_device_list(self) -> list[str]:
-        """ Get ST Link devices
+    def get_device_list(self, strict: bool=False) -> list[str]:
+        """ Get ST Link devices, an empty list if the CLI fails (raised if `strict`)
         """
         devices = []
         if self._fullfilename is None:
             raise ArgumentError('Missing fullfilename')
         try:
-            device_list = subprocess.check_output([self._fullfilename, '-List']).decode("utf-8").split()
+            device_list = self._exec(['-List'], LIST_TIMEOUT).split()
             for i, e in enumerate(device_list):
                 if e == 'SN:':
                     devices.append(device_list[i + 1])
 
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            pass
+            if strict:
+                raise
         return devices
 
     def get_readout_protection_level(self) -> int:
         """ Get Bit Fuse """
-
-        if self._serial == "":
-            comstr = f"{self._fullfilename} -c SWD Freq=4000 -rOB"
-        else:
-            comstr = f"{self._fullfilename} -c SWD Freq=4000 SN={self._serial} -rOB"
-
         try:
-            res = subprocess.check_output(comstr)
+            res = self._exec(self._connect_args(4000) + ['-rOB'])
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed find device!')
+            self._error('Failed find device!')
             return -1
 
-        res = res.decode("utf-8", errors='ignore').split()
+        res = res.split()
         if "RDP" not in res:
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed to read protection level!')
+            self._error('Failed to read protection level!')
             return -1
         return int(res[res.index("RDP")+3])
 
@@ -245,56 +606,85 @@ class STLink(STProgrammer):
         """ Set Bit Fuse
         """
         if level not in [0, 1, 2]:
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Protection level invalid!')
+            self._error('Protection level invalid!')
             return False
 
-        if self._serial == "":
-            comstr = f"{self._fullfilename} -c SWD Freq=4000 -OB RDP={level} -HardRst"
-        else:
-            comstr = f"{self._fullfilename} -c SWD Freq=4000 SN={self._serial} -OB RDP={level} -HardRst"
-
         try:
-            subprocess.check_output(comstr)
+            self._exec(self._connect_args(4000) + ['-OB', f'RDP={level}', '-HardRst'])
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed to write protection level!')
+            self._error('Failed to write protection level!')
             return False
         return True
 
+    def _connect_args(self, freq: int) -> list[str]:
+        """ Connection args """
+        args = ['-c', 'SWD', f'Freq={freq}']
+        if self._serial != "":
+            args.append(f'SN={self._serial}')
+        return args
+
     def _erase_sector(self, freq: int, sect: int=1) -> bool:
         """ Erase {sect} sector"""
         try:
-            if self._serial != "":
-                comstr = f"{self._fullfilename} -c SWD SN={self._serial} Freq={freq} -SE {sect}"
-            else:
-                comstr = f"{self._fullfilename} -c SWD Freq={freq} -SE {sect}"
-            subprocess.check_output(comstr)
+            self._exec(self._connect_args(freq) + ['-SE', str(sect)])
             return True
         except Exception:                                               # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Error to Erase Sector {sect}!')
+            self._error(f'Error to Erase Sector {sect}!')
             return False
 
     def _download_file(self, firmware: str, freq: int, addr: int) -> bool:
         """ Program device """
-        comstr = f"{self._fullfilename} -c SWD SN={self._serial} Freq={freq} -P {firmware} " \
-                    f"{hex(addr)} -V while_programming"
-        # else:
-        #     comstr = f"{self._fullfilename} -c SWD SN={self._serial} Freq={freq} -P {firmware} " \
-        #              f"{hex(addr)} -EL {loader} -V while_programming -HardRst"
+        # loader: -EL {loader} -HardRst
         try:
-            res = subprocess.check_output(comstr)
-            if 'Error occured during program operation!' in res.decode('utf-8'):
-                if callable(self._on_event):
-                    self._on_event(STEvent.ERROR, 'Error occured during program operation!')
+            res = self._exec(self._connect_args(freq) + ['-P', firmware, hex(addr), '-V', 'while_programming'])
+            if 'Error occured during program operation!' in res:
+                self._error('Error occured during program operation!')
                 return False
             return True
-        except Exception as ex:                                                 # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Error to program device!')
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
             return False
 
+    def _program_batch(self, firmware: str, freq: int, addr: int, prot: int) -> bool:
+        """ Unlock, erase, program, verify and lock the device with one connection """
+        args = self._connect_args(freq) + ['-OB', 'RDP=0', '-ME',
+                                           '-P', firmware, hex(addr), '-V', 'while_programming',
+                                           '-OB', f'RDP={prot}', '-HardRst']
+        try:
+            errors = self._exec_errors(args)
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
+            return False
+        if errors:
+            self._error(f'Error occured during program operation: {errors[0]}')
+            return False
+        return True
+
+    def _upload(self, freq: int, addr: int, size: int, filename: str) -> bool:
+        """ Read device memory to file """
+        try:
+            return not self._exec_errors(self._connect_args(freq) + ['-Dump', hex(addr), hex(size), filename])
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            return False
+
+    def _program_sectors(self, freq: int, sectors: list[int], chunks: list[tuple[str, int]], prot: int) -> bool:
+        """ Erase and program only the sectors given """
+        args = self._connect_args(freq)
+        for sect in sectors:
+            args += ['-SE', str(sect)]
+        for chunk, addr in chunks:
+            args += ['-P', chunk, hex(addr), '-V', 'while_programming']
+        args += ['-OB', f'RDP={prot}', '-HardRst']
+        try:
+            errors = self._exec_errors(args)
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
+            return False
+        if errors:
+            self._error(f'Error occured during program operation: {errors[0]}')
+            return False
+        return True
+
 
 class STM32Programmer(STProgrammer):
     """ STM32 Programmer programmer class
@@ -315,97 +705,117 @@ class STM32Programmer(STProgrammer):
         if not isfile(fullfilename):
             return None
         try:
-            return subprocess.check_output(f"{fullfilename } --version").decode('utf-8').splitlines()[4]
+            return run_process([fullfilename, '--version'], VERSION_TIMEOUT).check().splitlines()[4]
         except Exception:                                                       # pylint: disable=broad-exception-caught
             return None
 
-    def get_device_list(self) -> list[str]:
-        """ Get ST Link devices
+    def get_device_list(self, strict: bool=False) -> list[str]:
+        """ Get ST Link devices, an empty list if the CLI fails (raised if `strict`)
         """
         devices = []
         if self._fullfilename is None:
             raise ArgumentError('Missing fullfilename')
         try:
-            device_list = subprocess.check_output([self._fullfilename, '--List']).decode("utf-8").split()
+            device_list = self._exec(['--List'], LIST_TIMEOUT).split()
             for i, e in enumerate(device_list):
                 if e == 'SN':
                     devices.append(device_list[i + 2])
 
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            pass
+            if strict:
+                raise
         return devices
 
     def get_readout_protection_level(self) -> int:
         """ Get Bit Fuse """
-
-        if self._serial == "":
-            comstr = f"{self._fullfilename} -c port=SWD Freq=4000 -ob displ"
-        else:
-            comstr = f"{self._fullfilename} -c port=SWD Freq=4000 SN={self._serial} -ob displ"
-
         try:
-            res = subprocess.check_output(comstr)
+            res = self._exec(self._connect_args(4000) + ['-ob', 'displ'])
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed find device!')
+            self._error('Failed find device!')
             return -1
 
-        res = res.decode("utf-8", errors='ignore').split()
+        res = res.split()
         if "RDP" not in res:
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed to read protection level!')
+            self._error('Failed to read protection level!')
             return -1
         return int(res[res.index("RDP")+4][:-1])
 
     def set_readout_protection_level(self, level: int) -> bool:
         """ Set Bit Fuse
         """
-
-        if self._serial == "":
-            comstr = f"{self._fullfilename} -c port=SWD Freq=4000 -ob RDP={level}"
-        else:
-            comstr = f"{self._fullfilename} -c port=SWD Freq=4000 SN={self._serial} -ob RDP={level}"
-
         try:
-            subprocess.check_output(comstr)
+            self._exec(self._connect_args(4000) + ['-ob', f'RDP={level}'])
         except Exception:                                                       # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, 'Failed to write protection level!')
+            self._error('Failed to write protection level!')
             return False
         return True
 
+    def _connect_args(self, freq: int) -> list[str]:
+        """ Connection args """
+        args = ['-c', 'port=SWD', f'Freq={freq}']
+        if self._serial != "":
+            args.append(f'SN={self._serial}')
+        return args
+
     def _erase_sector(self, freq: int, sect: int=1) -> bool:
         """ Erase {sect} sector"""
         try:
-            if self._serial != "":
-                comstr = f"{self._fullfilename} -c port=SWD SN={self._serial} Freq={freq} -E {sect}"
-            else:
-                comstr = f"{self._fullfilename} -c port=SWD Freq={freq} -E {sect}"
-            subprocess.check_output(comstr)
+            self._exec(self._connect_args(freq) + ['-E', str(sect)])
             return True
         except Exception:                                               # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Error to Erase Sctor {sect}!')
+            self._error(f'Error to Erase Sctor {sect}!')
             return False
 
     def _download_file(self, firmware: str, freq: int, addr: int) -> bool:
         """ Program device """
-        comstr = f"{self._fullfilename} -c port=SWD SN={self._serial} Freq={freq} -e all -w {firmware} " \
-                 f"{hex(addr)} -V -HardRst"
-        # else:
-        #     comstr = f"{self._fullfilename} -c port=SWD SN={self._serial} Freq={freq} -w {firmware} " \
-        #                 f"{hex(addr)} -EL {loader} -HardRst"
+        # loader: -EL {loader} -HardRst
         try:
-            res = subprocess.check_output(comstr)
-            if 'Error occured during program operation!' in res.decode('utf-8'):
-                if callable(self._on_event):
-                    self._on_event(STEvent.ERROR, 'Error occured during program operation!')
+            res = self._exec(self._connect_args(freq) + ['-e', 'all', '-w', firmware, hex(addr), '-V', '-HardRst'])
+            if 'Error occured during program operation!' in res:
+                self._error('Error occured during program operation!')
                 return False
             return True
-        except Exception as ex:                                                 # pylint: disable=broad-exception-caught
-            if callable(self._on_event):
-                self._on_event(STEvent.ERROR, f'Error to program device!')
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
+            return False
+
+    def _program_batch(self, firmware: str, freq: int, addr: int, prot: int) -> bool:
+        """ Unlock, erase, program, verify and lock the device with one connection """
+        args = self._connect_args(freq) + ['-ob', 'RDP=0xAA', '-e', 'all',
+                                           '-w', firmware, hex(addr), '-v',
+                                           '-ob', f'RDP={prot}', '-HardRst']
+        try:
+            errors = self._exec_errors(args)
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
+            return False
+        if errors:
+            self._error(f'Error occured during program operation: {errors[0]}')
             return False
+        return True
+
+    def _upload(self, freq: int, addr: int, size: int, filename: str) -> bool:
+        """ Read device memory to file """
+        try:
+            return not self._exec_errors(self._connect_args(freq) + ['-u', hex(addr), str(size), filename])
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            return False
+
+    def _program_sectors(self, freq: int, sectors: list[int], chunks: list[tuple[str, int]], prot: int) -> bool:
+        """ Erase and program only the sectors given """
+        args = self._connect_args(freq) + ['-e'] + [str(sect) for sect in sectors]
+        for chunk, addr in chunks:
+            args += ['-w', chunk, hex(addr), '-v']
+        args += ['-ob', f'RDP={prot}', '-HardRst']
+        try:
+            errors = self._exec_errors(args)
+        except Exception:                                                       # pylint: disable=broad-exception-caught
+            self._error('Error to program device!')
+            return False
+        if errors:
+            self._error(f'Error occured during program operation: {errors[0]}')
+            return False
+        return True
 
 def test(fullfilename: str) -> None:
     """ Testing """
@@ -0,0 +1,17 @@
+""" Tests run from any folder: the project root is importable """
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(name='fake_cli')
+def fixture_fake_cli(tmp_path, monkeypatch) -> str:
+    """ STM32_Programmer_CLI stand-in of the benchmark with one probe and no delays, FAKE_ST_* can be changed """
+    from benchmark.bench import make_cli                                       # pylint: disable=import-outside-toplevel
+    monkeypatch.setenv('FAKE_ST_CLI', 'stm32')
+    monkeypatch.setenv('FAKE_ST_PROBES', '1')
+    for name in ('FAKE_ST_CONNECT', 'FAKE_ST_WRITE', 'FAKE_ST_LIST'):
+        monkeypatch.setenv(name, '0')
+    return make_cli(str(tmp_path), 'stm32')
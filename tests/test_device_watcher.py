@@ -0,0 +1,34 @@
+"""
+Tests of the probe inventory
+"""
+from tasks.utility import st_programmer
+from tasks.utility.device_watcher import DeviceWatcher, attached_units
+
+
+def test_list_failure_keeps_inventory(fake_cli, monkeypatch):
+    """ A listing killed by timeout does not detach the probes and is not an event of the task """
+    monkeypatch.setenv('FAKE_ST_PROBES', '2')
+    task_events = []
+    programmer = st_programmer.STProgrammerFactory.get_instance(fake_cli, lambda *event: task_events.append(event))
+    watcher = DeviceWatcher(programmer, use_udev=False)
+    events = []
+    watcher.subscribe(lambda event, serial: events.append(event))
+    watcher.scan()
+    assert len(watcher.devices) == 2 and events == ['attach', 'attach']
+
+    monkeypatch.setenv('FAKE_ST_LIST', '5')
+    monkeypatch.setattr(st_programmer, 'LIST_TIMEOUT', 0.2)
+    watcher.scan()
+    assert len(watcher.devices) == 2 and events == ['attach', 'attach']
+    assert not task_events and programmer.last_error == ''
+
+
+def test_attached_units_include_inventory(fake_cli, monkeypatch):
+    """ The probes attached before the first device is requested are all devices under test """
+    monkeypatch.setenv('FAKE_ST_PROBES', '2')
+    watcher = DeviceWatcher(st_programmer.STProgrammerFactory.get_instance(fake_cli), use_udev=False)
+    watcher.scan()
+    units = attached_units(watcher)
+    monkeypatch.setenv('FAKE_ST_PROBES', '3')
+    watcher.scan()
+    assert [next(units)['probe'] for _ in range(3)] == ['066DFF000000', '066DFF000001', '066DFF000002']
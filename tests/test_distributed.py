@@ -0,0 +1,32 @@
+"""
+Tests of the coordinator job queue
+"""
+import json
+import socket
+import time
+from helper.distributed import Coordinator
+
+SEQUENCE = {'Tasks': [{'task': 'a', 'module': 'test_task', 'args': None}]}
+
+
+def test_job_rejected_by_all_workers():
+    """ A job that no worker connected accepts is failed, join returns after its result is reported """
+    coordinator = Coordinator()
+    results = []
+
+    def on_result(result: dict) -> None:
+        time.sleep(0.2)
+        results.append(result)
+
+    coordinator.on_result = on_result
+    coordinator.start()
+    try:
+        with socket.create_connection(coordinator.address) as conn, conn.makefile('rw') as stream:
+            stream.write(json.dumps({'type': 'hello', 'name': 'w1', 'probes': ['P1'], 'tasks': ['test_task']}) + '\n')
+            stream.flush()
+            coordinator.submit(SEQUENCE, {'probe': 'NOPE'})
+            assert coordinator.join(5.0)
+    finally:
+        coordinator.close()
+    assert [result['status'] for result in results] == ['FAIL']
+    assert 'No worker can run job 1' in results[0]['errors'][0]
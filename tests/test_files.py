@@ -0,0 +1,34 @@
+"""
+Tests of the YAML cache
+"""
+import os
+import yaml
+from helper import files
+from helper.files import load_yaml, save_yaml
+
+
+def test_load_yaml_cached(tmp_path, monkeypatch):
+    """ A file not changed is parsed once, every call gets its own copy """
+    filename = tmp_path / 'config.yml'
+    filename.write_text('programmer: cli\nsectors: [1, 2]\n', encoding='utf-8')
+    parsed = []
+    real_load = yaml.load
+    monkeypatch.setattr(files.yaml, 'load', lambda *args, **kwargs: parsed.append(1) or real_load(*args, **kwargs))
+    first = load_yaml(str(filename))
+    first['sectors'].append(3)
+    second = load_yaml(str(filename))
+    assert second == {'programmer': 'cli', 'sectors': [1, 2]}
+    assert len(parsed) == 1
+
+
+def test_load_yaml_changed(tmp_path):
+    """ A file changed on disk or saved is parsed again """
+    filename = tmp_path / 'config.yml'
+    filename.write_text('value: 1\n', encoding='utf-8')
+    assert load_yaml(str(filename)) == {'value': 1}
+    filename.write_text('value: 2\n', encoding='utf-8')
+    info = os.stat(filename)
+    os.utime(filename, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000))
+    assert load_yaml(str(filename)) == {'value': 2}
+    save_yaml({'value': 3}, str(filename), False)
+    assert load_yaml(str(filename)) == {'value': 3}
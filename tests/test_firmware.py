@@ -0,0 +1,140 @@
+"""
+Tests of the Intel HEX parser and of the image helpers
+"""
+import random
+import pytest
+from tasks.utility import firmware
+from tasks.utility.firmware import FirmwareImage, crc32_mpeg2, crc32_stm32, merge_images, parse_hex
+
+
+def record(rtype: int, addr: int, data: bytes) -> str:
+    """ Intel HEX record """
+    raw = bytes([len(data), addr >> 8, addr & 0xFF, rtype]) + data
+    return ':' + (raw + bytes([-sum(raw) & 0xFF])).hex().upper()
+
+
+def hex_lines(data: bytes, addr: int=0, size: int=16) -> list[str]:
+    """ Records of the data, with the end of file record """
+    lines = [record(0, addr + offset, data[offset:offset + size]) for offset in range(0, len(data), size)]
+    return lines + [record(1, 0, b'')]
+
+
+def reference(lines: list[str]) -> list[tuple[int, bytes]]:
+    """ Segments decoded one line at a time """
+    segments = []
+    for line in lines:
+        raw = bytes.fromhex(line.strip()[1:])
+        if raw[3] == 0:
+            addr = raw[1] << 8 | raw[2]
+            if segments and segments[-1][0] + len(segments[-1][1]) == addr:
+                segments[-1] = (segments[-1][0], segments[-1][1] + raw[4:-1])
+            else:
+                segments.append((addr, raw[4:-1]))
+    return sorted(segments)
+
+
+def write(tmp_path, text: str) -> str:
+    """ HEX file with the text """
+    filename = tmp_path / 'firmware.hex'
+    filename.write_bytes(text.encode('ascii'))
+    return str(filename)
+
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize('ends', [
+    ['\r\n', '\n'],                                                             # mixed CRLF and LF
+    ['\n', '\r\n', '\r\n', '\n'],
+    ['\r\r\n', '\n'],                                                         # as many CR as LF, runs are cut
+    [' \r\n'] + ['\r\n'] * 100,                                                 # trailing space on the first line
+    ['\n'] * 10 + ['  \t\n'] + ['\n'] * 100,
+])
+def test_mixed_line_ends(tmp_path, ends):
+    """ Records with different line ends or trailing spaces are all decoded """
+    lines = hex_lines(DATA)
+    text = ''.join(line + ends[num % len(ends)] for num, line in enumerate(lines))
+    assert parse_hex(write(tmp_path, text)).segments == [(0, DATA)]
+
+
+def test_random_line_ends(tmp_path):
+    """ Same image as the line by line decoder, with random line ends and trailing spaces """
+    rnd = random.Random(1)
+    for _ in range(20):
+        lines = hex_lines(rnd.randbytes(rnd.randrange(1, 2000)), rnd.randrange(0x8000), rnd.choice((8, 16, 32)))
+        text = ''.join(line + rnd.choice(('\n', '\r\n', ' \n', '\t\r\n')) for line in lines)
+        assert parse_hex(write(tmp_path, text)).segments == reference(lines)
+
+
+def test_overlapping_records(tmp_path):
+    """ Records not in address order are kept as separate segments """
+    lines = [record(0, 0x0000, DATA[:16]), record(0, 0x0008, DATA[16:24]), record(0, 0x0010, DATA[24:40]),
+             record(1, 0, b'')]
+    image = parse_hex(write(tmp_path, '\n'.join(lines) + '\n'))
+    assert image.segments == reference(lines)
+    assert image.to_bin() == DATA[:8] + DATA[16:24] + DATA[24:40]
+
+
+def test_invalid_record(tmp_path):
+    """ The first record not valid is reported """
+    lines = hex_lines(DATA)
+    lines[5] = lines[5][:-4] + 'ZZ' + lines[5][-2:]
+    with pytest.raises(ValueError, match='Invalid record 6 '):
+        parse_hex(write(tmp_path, '\r\n'.join(lines)))
+
+
+def test_checksum_error(tmp_path):
+    """ The first record with a wrong checksum is reported, the check can be skipped """
+    lines = hex_lines(DATA)
+    lines[7] = lines[7][:-2] + ('00' if lines[7][-2:] != '00' else '01')
+    filename = write(tmp_path, '\n'.join(lines))
+    with pytest.raises(ValueError, match='Checksum error at record 8 '):
+        parse_hex(filename)
+    assert parse_hex(filename, verify=False).segments == [(0, DATA)]
+
+
+def test_missing_end(tmp_path):
+    """ A file without end of file record is not valid """
+    with pytest.raises(ValueError, match='Missing end of file'):
+        parse_hex(write(tmp_path, '\n'.join(hex_lines(DATA)[:-1])))
+
+
+def test_merge_overlap():
+    """ Overlapping images are refused, unless the next image overwrites """
+    boot = FirmwareImage([(0x0000, b'\x01' * 16)])
+    app = FirmwareImage([(0x0008, b'\x02' * 16)])
+    with pytest.raises(ValueError, match='overlap at 0x00000008'):
+        merge_images([boot, app])
+    assert merge_images([boot, app], overwrite=True).segments == [(0, b'\x01' * 8 + b'\x02' * 16)]
+
+
+def test_crc():
+    """ CRC-32/MPEG-2 check value, the STM32 CRC unit works on little endian words """
+    assert crc32_mpeg2(b'123456789') == 0x0376E6E7
+    assert crc32_stm32(b'\x04\x03\x02\x01') == crc32_mpeg2(b'\x01\x02\x03\x04')
+
+
+def test_cache_image(tmp_path):
+    """ A firmware is converted once, the image is mapped once and shared, a writable one is a private copy """
+    data = bytes(range(256))
+    cache = firmware.get_cache(str(tmp_path / 'cache'))
+    assert firmware.get_cache(str(tmp_path / 'cache')) is cache
+    filename = write(tmp_path, '\n'.join(hex_lines(data, 0x100)))
+    image, base = cache.open_image(filename)
+    assert (image[:], base) == (data, 0x100)
+    assert cache.open_image(filename)[0] is image
+    copy, _ = cache.open_image(filename, writable=True)
+    firmware.patch(copy, base, 0x100, b'\x55')
+    assert copy[0] == 0x55 and image[0] == 0
+    assert sorted(path.suffix for path in (tmp_path / 'cache').iterdir()) == ['.bin', '.json']
+
+
+def test_cache_not_convertible(tmp_path, monkeypatch):
+    """ A firmware that is not a single binary image is parsed only once """
+    lines = hex_lines(b'\x01' * 16)[:-1] + [record(4, 0, b'\x00\x10')] + hex_lines(b'\x02' * 16)
+    filename = write(tmp_path, '\n'.join(lines))
+    cache = firmware.FirmwareCache(str(tmp_path / 'cache'))
+    assert cache.get(filename) is None
+    monkeypatch.setattr(firmware, 'parse_hex', lambda filename: pytest.fail('parsed again'))
+    assert cache.get(filename) is None
+    assert firmware.FirmwareCache(str(tmp_path / 'cache')).open_image(filename) is None
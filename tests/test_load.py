@@ -0,0 +1,25 @@
+"""
+Tests of the warm task instances
+"""
+from helper.files import save_yaml
+from helper.load import TaskPool
+
+
+def test_task_pool_reuse(tmp_path):
+    """ An instance released is given again to the same module and config path, built only if none is idle """
+    save_yaml({'say_ho_ho': 'Ho ho ho!'}, str(tmp_path / 'test_task.yml'), False)
+    pool = TaskPool()
+    first = pool.acquire('test_task', str(tmp_path), None)
+    second = pool.acquire('test_task', str(tmp_path), None)
+    assert first is not second
+    pool.release('test_task', str(tmp_path), first)
+    assert pool.idle('test_task', str(tmp_path)) == 1
+    assert pool.idle('test_task', str(tmp_path / 'other')) == 0
+    events = []
+    assert pool.acquire('test_task', str(tmp_path), None, lambda *event: events.append(event)) is first
+    assert pool.idle('test_task', str(tmp_path)) == 0
+    first.run()
+    assert events
+    pool.release('test_task', str(tmp_path), first)
+    pool.clear()
+    assert pool.idle('test_task', str(tmp_path)) == 0
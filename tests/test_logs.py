@@ -0,0 +1,40 @@
+"""
+Tests of the logging through the queue
+"""
+import json
+import logging
+import queue
+from helper.logs import ContextFilter, JsonFormatter, RecordQueueHandler, log_context
+
+
+def queued_record(logger_name: str) -> logging.LogRecord:
+    """ Record of an exception logged through the queue handler """
+    records = queue.SimpleQueue()
+    handler = RecordQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(logger_name)
+    logger.addHandler(handler)
+    try:
+        with log_context(serial='066DFF000001'):
+            try:
+                raise ValueError('bad image')
+            except ValueError:
+                logger.exception('Unit %s failed', 1)
+    finally:
+        logger.removeHandler(handler)
+    return records.get_nowait()
+
+
+def test_json_exception_field():
+    """ The traceback is the `exception` field, not part of the message """
+    data = json.loads(JsonFormatter().format(queued_record('test_logs.json')))
+    assert data['message'] == 'Unit 1 failed'
+    assert data['serial'] == '066DFF000001'
+    assert 'ValueError: bad image' in data['exception'] and data['exception'].startswith('Traceback')
+
+
+def test_text_traceback():
+    """ The text format still writes the traceback after the message """
+    text = logging.Formatter('%(context)s%(message)s').format(queued_record('test_logs.text'))
+    assert text.startswith('[066DFF000001] Unit 1 failed\nTraceback')
+    assert text.endswith('ValueError: bad image')
@@ -0,0 +1,34 @@
+"""
+Tests of the Prometheus text format
+"""
+from helper.metrics import Metrics
+
+
+def test_render():
+    """ Metrics sorted by name, with help, type, escaped labels and cumulative buckets """
+    metrics = Metrics()
+    units = metrics.counter('pytask_units_total', 'Units completed', ('status',))
+    units.inc(status='PASS')
+    units.inc(2, status='FAIL')
+    assert metrics.counter('pytask_units_total', 'Units completed', ('status',)) is units
+    metrics.gauge('pytask_queue_depth', 'Queued', ('queue',)).set(3, queue='a "b"\n')
+    seconds = metrics.histogram('pytask_flash_seconds', 'Flash time', buckets=(0.5, 1.0))
+    seconds.observe(0.25)
+    seconds.observe(0.75)
+    seconds.observe(5)
+    assert metrics.render() == '\n'.join([
+        '# HELP pytask_flash_seconds Flash time',
+        '# TYPE pytask_flash_seconds histogram',
+        'pytask_flash_seconds_bucket{le="0.5"} 1',
+        'pytask_flash_seconds_bucket{le="1"} 2',
+        'pytask_flash_seconds_bucket{le="+Inf"} 3',
+        'pytask_flash_seconds_sum 6',
+        'pytask_flash_seconds_count 3',
+        '# HELP pytask_queue_depth Queued',
+        '# TYPE pytask_queue_depth gauge',
+        'pytask_queue_depth{queue="a \\"b\\"\\n"} 3',
+        '# HELP pytask_units_total Units completed',
+        '# TYPE pytask_units_total counter',
+        'pytask_units_total{status="FAIL"} 2',
+        'pytask_units_total{status="PASS"} 1',
+    ]) + '\n'
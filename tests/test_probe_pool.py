@@ -0,0 +1,19 @@
+"""
+Tests of the probe pool
+"""
+from tasks.utility.probe_pool import ProbePool
+from tasks.utility.st_programmer import STEvent, STProgrammerFactory
+
+
+def test_program_with_caller_programmer(fake_cli, tmp_path, monkeypatch):
+    """ The jobs are cloned from the programmer of the caller: its events and options, not the first task's """
+    monkeypatch.setenv('FAKE_ST_PROBES', '2')
+    first, second = [], []
+    pool = ProbePool(STProgrammerFactory.get_instance(fake_cli, lambda *event: first.append(event)))
+    programmer = STProgrammerFactory.get_instance(fake_cli, lambda *event: second.append(event))
+    filename = tmp_path / 'firmware.bin'
+    filename.write_bytes(b'\x00' * 1024)
+    firmware = {'file': str(filename), 'addr': 0x08000000, 'freq': 4000, 'prot': 0}
+    done, serials = pool.program(firmware, 1, programmer)
+    assert done and len(serials) == 1
+    assert not first and (STEvent.PROGRESS, f'[{serials[0]}] 100%') in second
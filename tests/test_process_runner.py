@@ -0,0 +1,23 @@
+"""
+Tests of the CLI runner
+"""
+import sys
+from time import monotonic
+from tasks.utility.process_runner import run_process
+
+SCRIPT = "import time; print('10%', flush=True); print('Error: no target', flush=True); time.sleep(10); print('100%')"
+
+
+def test_error_lines():
+    """ The lines with an error marker are collected, the progress is forwarded """
+    progress = []
+    result = run_process([sys.executable, '-c', SCRIPT.replace('time.sleep(10)', 'pass')], 10, progress.append)
+    assert result.errors == ['Error: no target'] and progress == [10, 100] and result.returncode == 0
+
+
+def test_stop_on_error():
+    """ The process is killed at the first error line """
+    start = monotonic()
+    result = run_process([sys.executable, '-c', SCRIPT], 10, stop_on_error=True)
+    assert result.errors == ['Error: no target'] and result.returncode != 0
+    assert monotonic() - start < 5
@@ -0,0 +1,13 @@
+"""
+Tests of the devices read from a stream
+"""
+import io
+from helper.production import units_from_stream
+
+
+def test_invalid_line_skipped():
+    """ A line not valid is reported and the next lines are read """
+    errors = []
+    units = list(units_from_stream(io.StringIO('{bad json\n\nSN1\n{"probe": "P1"}\n'), errors.append))
+    assert units == [{'serial': 'SN1'}, {'probe': 'P1'}]
+    assert len(errors) == 1 and errors[0].startswith('Invalid unit')
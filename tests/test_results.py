@@ -0,0 +1,34 @@
+"""
+Tests of the result store
+"""
+from helper.results import ResultStore, connect, query_units, summary
+
+
+def unit_result(serial: str, status: str, duration: float, failed_task: str|None=None) -> dict:
+    """ Result of a unit with two tasks """
+    tasks = [{'task': 'flash', 'status': 'PASS', 'wait': 0.0, 'duration': duration, 'error': None},
+             {'task': 'check', 'status': 'FAIL' if failed_task == 'check' else 'PASS', 'wait': 0.1,
+              'duration': 0.2, 'error': 'bad crc' if failed_task == 'check' else None}]
+    return {'unit': {'serial': serial, 'firmware': 'abc'}, 'status': status, 'duration': duration,
+            'errors': ['bad crc'] if failed_task else [], 'tasks': tasks}
+
+
+def test_add_and_query(tmp_path):
+    """ The results added are all written at close, with their tasks """
+    filename = str(tmp_path / 'log' / 'results.sqlite')
+    store = ResultStore(filename, batch_size=2, flush_interval=10.0)
+    store.add(unit_result('066DFF000001', 'PASS', 1.0), 'Line')
+    store.add(unit_result('066DFF000002', 'FAIL', 3.0, 'check'), 'Line')
+    store.add(unit_result('066DFF000001', 'PASS', 2.0), 'Line')
+    store.close()
+
+    conn = connect(filename)
+    units = query_units(conn, serial='066DFF000001')
+    assert [(unit['status'], unit['duration'], unit['sequence']) for unit in units] == \
+           [('PASS', 2.0, 'Line'), ('PASS', 1.0, 'Line')]
+    failed = query_units(conn, status='FAIL')
+    assert [(unit['serial'], unit['errors']) for unit in failed] == [('066DFF000002', '["bad crc"]')]
+    assert summary(conn) == {'units': 3, 'passed': 2, 'failed': 1, 'mean_duration': 2.0, 'max_duration': 3.0,
+                             'failures_by_task': {'check': 1}}
+    assert query_units(conn, since=units[0]['time'] + 1) == []
+    conn.close()
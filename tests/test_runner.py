@@ -0,0 +1,38 @@
+"""
+Tests of the sequence structure checks
+"""
+import pytest
+from helper.load import TaskRegistry
+from helper.runner import get_steps
+
+
+@pytest.mark.parametrize('sequence, message', [
+    ({'Name': 'x'}, 'Missing "Tasks"'),
+    ({'Tasks': ['a']}, 'Entry 1'),
+    ({'Tasks': [{'group': 'g'}]}, 'Group "g"'),
+    ({'Tasks': [{'task': 'a', 'module': 'test_task'}]}, 'Task "a": missing "args"'),
+    ({'Tasks': [{'task': 'a', 'args': None}]}, 'Task "a": missing "module"'),
+    ({'Tasks': [{'group': 'g', 'tasks': [{'module': 'test_task', 'args': None}]}]}, 'Task "entry 1": missing "task"'),
+])
+def test_invalid_structure(sequence, message):
+    """ A sequence with a missing key raises a ValueError with the task name """
+    with pytest.raises(ValueError, match=message):
+        get_steps(sequence)
+
+
+def test_valid_sequence():
+    """ Plain tasks run serially """
+    steps = get_steps({'Tasks': [{'task': 'a', 'module': 'test_task', 'args': None},
+                                 {'task': 'b', 'module': 'test_task', 'args': None}]})
+    assert [step['depends_on'] for step in steps] == [[], ['a']]
+
+
+def test_execution_read_without_import(tmp_path):
+    """ The execution of a task class is read from the source, the module is not imported """
+    (tmp_path / 'heavy_task.py').write_text("raise ImportError('not to import')\n\n"
+                                            "class Heavy:\n    execution = 'process'\n\n"
+                                            "def get_task(configpath, args, callback=None):\n    return Heavy()\n")
+    (tmp_path / 'light_task.py').write_text("def get_task(configpath, args, callback=None):\n    return None\n")
+    tasks = TaskRegistry(str(tmp_path))
+    assert tasks.get_execution('heavy_task') == 'process'
+    assert tasks.get_execution('light_task') == 'thread'
@@ -0,0 +1,57 @@
+"""
+Tests of the dependency graph and of the run report
+"""
+import pytest
+from helper.scheduler import Schedule, topological_order
+
+
+def steps(**graph) -> list[dict]:
+    """ Steps with the dependencies of each name """
+    return [{'name': name, 'depends_on': deps} for name, deps in graph.items()]
+
+
+def test_topological_order():
+    """ Every task follows its dependencies, the independent ones keep the listed order """
+    order = topological_order(steps(flash=['hash', 'probe'], hash=[], probe=[], check=['flash'], read=[]))
+    assert order == ['hash', 'probe', 'read', 'flash', 'check']
+
+
+def test_dependency_cycle():
+    """ A cycle is a ValueError with the tasks of the cycle """
+    with pytest.raises(ValueError, match=r"Dependency cycle between tasks \['a', 'b'\]!"):
+        topological_order(steps(start=[], a=['start', 'b'], b=['a']))
+
+
+def timed(schedule: Schedule, name: str, ready: float, start: float, end: float) -> None:
+    """ Set the timing of a task, seconds from the origin """
+    timing = schedule.timings[name]
+    timing.ready, timing.start, timing.end = (schedule.origin + value for value in (ready, start, end))
+
+
+def test_critical_path():
+    """ The path follows back the dependency completed last """
+    schedule = Schedule(steps(probe=[], hash=[], flash=['probe', 'hash'], log=[], check=['flash']))
+    timed(schedule, 'probe', 0.0, 0.0, 1.0)
+    timed(schedule, 'hash', 0.0, 0.0, 3.0)
+    timed(schedule, 'flash', 3.0, 3.5, 5.0)
+    timed(schedule, 'log', 0.0, 0.0, 0.5)
+    timed(schedule, 'check', 5.0, 5.0, 6.0)
+    assert schedule.critical_path() == ['hash', 'flash', 'check']
+    assert Schedule(steps(a=[])).critical_path() == []
+
+
+def test_report():
+    """ The report has start, wait and run time of each task, the critical path and the errors """
+    schedule = Schedule(steps(probe=[], flash=['probe'], check=['flash']))
+    timed(schedule, 'probe', 0.0, 0.0, 1.0)
+    timed(schedule, 'flash', 1.0, 1.25, 3.0)
+    schedule.failed('check', RuntimeError('no probe'))
+    assert schedule.report().splitlines() == [
+        'Task      Start      Wait       Run',
+        'probe     0.000     0.000     1.000',
+        'flash     1.250     0.250     1.750',
+        'check         -         -         -',
+        'Critical path: probe -> flash',
+        "Failed: check: RuntimeError('no probe')",
+    ]
+    assert [task['status'] for task in schedule.tasks()] == ['PASS', 'PASS', 'FAIL']
@@ -0,0 +1,82 @@
+""" STProgrammer with the fake ST CLI of the benchmark """
+import pytest
+from tasks.utility import st_programmer
+from tasks.utility.st_programmer import STEvent, STProgrammerFactory
+
+
+@pytest.fixture(name='programmer')
+def fixture_programmer(fake_cli):
+    """ Programmer of the fake CLI, the events are collected """
+    events = []
+    pgm = STProgrammerFactory.get_instance(fake_cli, lambda *event: events.append(event))
+    pgm.events = events
+    return pgm
+
+
+def firmware(tmp_path, data: bytes, diff: str) -> dict:
+    """ Binary firmware description """
+    filename = tmp_path / 'firmware.bin'
+    filename.write_bytes(data)
+    return {'file': str(filename), 'addr': 0x08000000, 'freq': 4000, 'prot': 0, 'diff': diff}
+
+
+def test_diff_skip_identical(programmer, tmp_path):
+    """ The fake flash reads back erased: an erased image is not programmed again """
+    assert programmer.program_wait(firmware(tmp_path, b'\xff' * 1024, 'skip'))
+    assert (STEvent.OK, 'Firmware already programmed') in programmer.events
+    assert (STEvent.PROGRESS, '100%') not in programmer.events
+
+
+def test_diff_skip_different(programmer, tmp_path):
+    """ A different image is programmed """
+    assert programmer.program_wait(firmware(tmp_path, b'\x00' * 1024, 'skip'))
+    assert (STEvent.OK, 'Firmware already programmed') not in programmer.events
+    assert (STEvent.PROGRESS, '100%') in programmer.events
+
+
+def test_diff_upper_case_extension(programmer, tmp_path):
+    """ The extension of a binary image is not case sensitive """
+    data = firmware(tmp_path, b'\xff' * 1024, 'skip')
+    data['file'] = str((tmp_path / 'firmware.bin').rename(tmp_path / 'FIRMWARE.BIN'))
+    assert programmer.program_wait(data)
+    assert (STEvent.OK, 'Firmware already programmed') in programmer.events
+
+
+def test_diff_empty_image(programmer, tmp_path):
+    """ An empty binary image is an error, not an exception of the programming thread """
+    assert not programmer.program_wait(firmware(tmp_path, b'', 'skip'))
+    assert 'Empty firmware file' in programmer.last_error
+
+
+def test_program_all_exception(programmer, tmp_path, monkeypatch):
+    """ An exception of a probe is its failed result, the other probes are still reported """
+    monkeypatch.setenv('FAKE_ST_PROBES', '2')
+    data = firmware(tmp_path, b'\x00' * 1024, None)
+    program_wait = type(programmer).program_wait
+
+    def failing(probe, image):
+        if probe.serial.endswith('1'):
+            raise OSError('probe lost')
+        return program_wait(probe, image)
+
+    monkeypatch.setattr(type(programmer), 'program_wait', failing)
+    results = programmer.program_all(data)
+    assert len(results) == 2 and sorted(results.values()) == [False, True]
+    failed = next(serial for serial, done in results.items() if not done)
+    assert programmer.last_errors == {failed: "OSError('probe lost')"}
+
+
+def test_factory_detects_once(fake_cli, tmp_path, monkeypatch):
+    """ The programmer is detected once: the next instances, also of a new process with the cache file, run no CLI """
+    calls = []
+    run_process = st_programmer.run_process
+    monkeypatch.setattr(st_programmer, 'run_process', lambda args, *rest, **kwargs: calls.append(args) or
+                        run_process(args, *rest, **kwargs))
+    cache_file = str(tmp_path / 'detect.cache.json')
+    assert type(STProgrammerFactory.get_instance(fake_cli, cache_file=cache_file)).__name__ == 'STM32Programmer'
+    assert calls
+    calls.clear()
+    STProgrammerFactory.get_instance(fake_cli)
+    monkeypatch.setattr(STProgrammerFactory, '_detected', {})
+    assert type(STProgrammerFactory.get_instance(fake_cli, cache_file=cache_file)).__name__ == 'STM32Programmer'
+    assert not calls
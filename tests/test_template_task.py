@@ -0,0 +1,14 @@
+"""
+Tests of the task base class
+"""
+from os import path
+from tasks.test_task import get_task
+
+CONFIG_PATH = path.join(path.dirname(__file__), path.pardir, 'config')
+
+
+def test_unit_per_instance():
+    """ Without set_unit every task has its own device under test """
+    first, second = get_task(CONFIG_PATH, {}), get_task(CONFIG_PATH, {})
+    first._unit['firmware'] = 'abc'                                             # pylint: disable=protected-access
+    assert second._unit == {}                                                   # pylint: disable=protected-access
@@ -0,0 +1,27 @@
+"""
+Tests of the timing sinks
+"""
+import json
+from helper.timing import JsonLinesSink, PhaseStats, summary
+
+
+def test_phase_stats_bounded():
+    """ The stats keep one entry for each phase, the summary is the same as from the spans """
+    stats = PhaseStats()
+    records = [{'phase': 'run', 'duration': 0.5}, {'phase': 'run', 'duration': 1.5}, {'phase': 'load', 'duration': 1.0}]
+    for record in records * 100:
+        stats.write(record)
+    assert stats.phases == {'run': (200, 200.0, 1.5), 'load': (100, 100.0, 1.0)}
+    assert summary(stats.clear()) == summary(records * 100)
+    assert not stats.phases
+
+
+def test_json_lines_sink(tmp_path):
+    """ The spans queued are all written at close """
+    filename = tmp_path / 'timing.jsonl'
+    sink = JsonLinesSink(str(filename))
+    for num in range(1000):
+        sink.write({'phase': 'run', 'num': num})
+    sink.close()
+    lines = filename.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['num'] for line in lines] == list(range(1000))